@@ -0,0 +1,304 @@
+"""
+Reproducible benchmarks for the hot paths of the bot.
+
+Generates synthetic master server payloads and history databases from a fixed seed, times the
+overview embed, snapshot saving, reminder matching, the stats aggregation and plot rendering, and
+appends the results to bench_output.txt together with the current commit. Every run is compared
+with the previous run of the same benchmark, so regressions show up between commits.
+
+    python benchmark.py [--games 400] [--clients 8] [--years 1] [--repeat 5] [--history-db bench_history.sqlite]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import db
+import history
+import main
+import master_server
+import player_names
+import reminders
+import rendering
+import snapshot_buffer
+
+RESULTS_PATH = "bench_output.txt"
+MODS = ["ca", "ra", "cnc", "d2k", "ts", "sp", "rv"]
+VERSIONS = ["1.06.2", "1.06.1", "v1.05", "1.04", "devtest-20250101", "1.07-pre2", "release-20231010"]
+MAPS = ["Desert Storm", "Frozen Lake", "Twin Rivers", "Island Hopping", "Urban Assault"]
+
+
+def generate_player_names(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    syllables = ["ka", "zo", "mi", "ra", "te", "lu", "vor", "x", "qu", "an", "el", "dr"]
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize() + str(rng.randint(0, 999)))
+    return sorted(names)
+
+
+def generate_games(mods: int = 5, games: int = 400, clients: int = 8, seed: int = 0,
+                   player_names: list[str] | None = None) -> list[dict]:
+    """
+    Game list like the one of the master server, spread over the first `mods` mods of MODS.
+
+    Games have up to `clients` clients, about a third of the games are empty, some clients are bots.
+    """
+    rng = random.Random(seed)
+    player_names = player_names or generate_player_names(max(games * clients, 1), seed)
+    result = []
+    for game_id in range(games):
+        mod = MODS[game_id % min(max(mods, 1), len(MODS))]
+        client_count = 0 if rng.random() < 0.33 else rng.randint(1, clients)
+        game_clients = []
+        for slot in range(client_count):
+            is_bot = rng.random() < 0.1
+            game_clients.append({
+                "name": "Bot" if is_bot else rng.choice(player_names), "fingerprint": f"{rng.getrandbits(64):016x}",
+                "color": f"{rng.getrandbits(24):06X}", "faction": rng.choice(["Allies", "Soviet", "Random"]),
+                "team": slot % 2 + 1, "spawnpoint": slot, "isadmin": slot == 0, "isspectator": False, "isbot": is_bot,
+            })
+        result.append({
+            "id": game_id, "name": f"Game {game_id}", "address": f"10.0.{game_id // 250}.{game_id % 250}:1234",
+            "state": rng.choice([1, 1, 2]), "ttl": 600, "mod": mod,
+            "version": rng.choice(VERSIONS) if mod == "ca" else "release-20250330",
+            "modtitle": mod.upper(), "modwebsite": "https://example.com", "modicon32": "https://example.com/icon.png",
+            "map": rng.choice(MAPS), "players": sum(not client["isbot"] for client in game_clients),
+            "bots": sum(client["isbot"] for client in game_clients), "spectators": 0, "maxplayers": clients,
+            "protected": rng.random() < 0.1, "authentication": False, "location": "Europe",
+            "started": "", "playtime": -1, "clients": game_clients,
+        })
+    return result
+
+
+def generate_payload(mods: int = 5, games: int = 400, clients: int = 8, seed: int = 0) -> bytes:
+    return json.dumps(generate_games(mods, games, clients, seed)).encode()
+
+
+def generate_history_db(path: str, years: float = 1, interval: int = 300, games: int = 20, clients: int = 8,
+                        seed: int = 0, now: datetime.datetime | None = None) -> int:
+    """
+    Write a history with one snapshot every `interval` seconds over `years` years into a new database.
+
+    The player counts follow a daily curve, so the rollups and charts look like real data. Returns
+    the number of snapshots.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = db.connect(path)
+    db.ensure_schema(conn)
+
+    now = int((now or datetime.datetime.now(datetime.timezone.utc)).timestamp())
+    end = now - now % interval
+    start = end - int(years * 365 * history.DAY)
+    player_names = generate_player_names(games * clients * 4, seed)
+    pool = [game for game in generate_games(1, games, clients, seed, player_names) if game["players"] > 0]
+
+    count = 0
+    for timestamp in range(start, end, interval):
+        day_fraction = (timestamp % history.DAY) / history.DAY
+        active = max(0, round(len(pool) * (0.5 + 0.4 * math.sin(2 * math.pi * day_fraction)) + rng.randint(-2, 2)))
+        # most games stay unchanged between two snapshots, like on the real server
+        if rng.random() < 0.2:
+            pool[rng.randrange(len(pool))]["map"] = rng.choice(MAPS)
+        # started games report their playtime, which changes in every snapshot
+        for game in pool:
+            if game["state"] == 2:
+                game["playtime"] = game["playtime"] + interval if game["playtime"] >= 0 else 0
+        history.insert_snapshot(conn, timestamp, pool[:active])
+        count += 1
+        if count % 10000 == 0:
+            conn.commit()
+    conn.commit()
+    conn.close()
+    return count
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_previous_results(path: str = RESULTS_PATH) -> dict[str, dict]:
+    # newest recorded result per benchmark name
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                previous[result["name"]] = result
+    return previous
+
+
+def measure(fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+class BenchmarkRun:
+    def __init__(self, repeat: int, parameters: dict):
+        self.repeat = repeat
+        self.parameters = parameters
+        self.commit = get_commit()
+        self.previous = load_previous_results()
+        self.results = []
+
+    def bench(self, name: str, fn, repeat: int | None = None):
+        # one warm-up call, so caches and lazy imports do not end up in the timings
+        fn()
+        timings = measure(fn, repeat or self.repeat)
+        result = {"name": name, "commit": self.commit, "median_ms": statistics.median(timings) * 1000,
+                  "min_ms": min(timings) * 1000, "runs": len(timings), "parameters": self.parameters,
+                  "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")}
+        self.results.append(result)
+
+        line = f"{name:<40} median {result['median_ms']:10.2f} ms   min {result['min_ms']:10.2f} ms"
+        previous = self.previous.get(name)
+        if previous is not None and previous.get("parameters") == self.parameters and previous["median_ms"] > 0:
+            change = (result["median_ms"] / previous["median_ms"] - 1) * 100
+            line += f"   {change:+6.1f}% vs {previous['commit']}"
+        print(line)
+
+    def save(self, path: str = RESULTS_PATH):
+        with open(path, "a") as f:
+            for result in self.results:
+                f.write(json.dumps(result) + "\n")
+
+
+def run_benchmarks(args):
+    parameters = {"mods": args.mods, "games": args.games, "clients": args.clients, "years": args.years,
+                  "interval": args.interval, "reminders": args.reminders}
+    run = BenchmarkRun(args.repeat, parameters)
+
+    payload = generate_payload(args.mods, args.games, args.clients, args.seed)
+    print(f"Payload: {len(payload) / 1e6:.2f} MB, {args.games} games of {args.mods} mods")
+
+    def parse_payload():
+        parser = master_server.GameListParser(master_server.mod_names)
+        for i in range(0, len(payload), 65536):
+            parser.feed(payload[i:i + 65536])
+        return parser.close()
+
+    run.bench("parse_payload", parse_payload)
+    ca_games = parse_payload()
+    run.bench("create_games_overview_embed", lambda: main.create_games_overview_embed(ca_games))
+    run.bench("create_games_overview_embed[all]",
+              lambda: main.create_games_overview_embed(ca_games, show_empty=True, show_outdated=True))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.init(os.path.join(tmp_dir, "bench.sqlite"))
+        snapshot_buffer.journal_path = os.path.join(tmp_dir, "snapshot_journal.jsonl")
+        try:
+            run.bench("save_data_to_db", lambda: asyncio.run(main.save_data_to_db(ca_games)))
+
+            def flush_batch():
+                for i in range(snapshot_buffer.flush_size):
+                    snapshot_buffer._pending.append((i, ca_games))
+                asyncio.run(snapshot_buffer.flush())
+            run.bench(f"snapshot_buffer.flush[{snapshot_buffer.flush_size} snapshots]", flush_batch)
+            run_reminder_benchmark(run, ca_games, args)
+        finally:
+            db.close()
+
+        history_path = os.path.join(tmp_dir, "history.sqlite")
+        if args.history_db and os.path.exists(args.history_db):
+            shutil.copyfile(args.history_db, history_path)
+        else:
+            start = time.perf_counter()
+            count = generate_history_db(history_path, args.years, args.interval, seed=args.seed)
+            print(f"Generated {count} snapshots in {time.perf_counter() - start:.1f}s")
+            if args.history_db:
+                shutil.copyfile(history_path, args.history_db)
+        run_history_benchmarks(run, history_path)
+
+    run.save()
+    print(f"Results appended to {RESULTS_PATH}")
+
+
+def run_reminder_benchmark(run: BenchmarkRun, ca_games: list[dict], args):
+    # reminders for every online player and many offline ones, the DMs themselves are not part of the timing
+    online_names = [client["name"] for game in ca_games for client in game.get("clients", []) if not client["isbot"]]
+    offline_names = generate_player_names(args.reminders, args.seed + 1)
+    reminder_names = [(name.lower(), 1000 + i) for i, name in enumerate(offline_names + online_names)]
+
+    async def deliver(discord_id, names):
+        return True
+
+    send_reminder = main.send_reminder
+    main.send_reminder = deliver
+    try:
+        def check():
+            asyncio.run(db.write(lambda conn: conn.executemany(
+                'INSERT OR IGNORE INTO reminder_names (name_lower, discord_id) VALUES (?, ?)', reminder_names)))
+            reminders.build_index(reminder_names)
+            asyncio.run(main.check_for_reminders(ca_games))
+        run.bench("check_for_reminders", check)
+    finally:
+        main.send_reminder = send_reminder
+
+
+def run_history_benchmarks(run: BenchmarkRun, history_path: str):
+    conn = db.connect(history_path)
+    try:
+        def rebuild_rollups():
+            for table in history.ROLLUP_TABLES.values():
+                conn.execute(f'DELETE FROM {table}')
+            conn.execute('DELETE FROM rollup_watermarks')
+            history.update_rollups(conn)
+            conn.commit()
+
+        run.bench("update_rollups[full]", rebuild_rollups, repeat=1)
+        run.bench("update_rollups[noop]", lambda: history.update_rollups(conn))
+
+        series = {}
+        for period in history.STATS_PERIODS:
+            run.bench(f"get_average_player_count_series[{period}]",
+                      lambda period=period: series.__setitem__(period, history.get_average_player_count_series(conn, period)))
+        run.bench("get_average_player_count_buckets[raw day]",
+                  lambda: history.get_average_player_count_buckets(
+                      conn, int(series["day"][0][0].timestamp()), history.HOUR, history.STATS_PERIODS["day"][1]))
+        run.bench("player_names.search_names[substring]", lambda: player_names.search_names(conn, "zomi"))
+        run.bench("player_names.search_names[prefix]", lambda: player_names.search_names(conn, "ka"))
+    finally:
+        conn.close()
+
+    for period in ("day", "year"):
+        bucket_times, player_counts = series[period]
+        run.bench(f"create_plot[{period}, {rendering.plot_profile}]",
+                  lambda: rendering.create_plot(bucket_times, player_counts, main.stats_titles[period], "Time",
+                                                "Average Player Count", period=period, timezone="Europe/Berlin",
+                                                profile=rendering.plot_profile))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the bot with synthetic data.")
+    parser.add_argument("--mods", type=int, default=5)
+    parser.add_argument("--games", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--reminders", type=int, default=10000)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--interval", type=int, default=300, help="seconds between two generated snapshots")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history-db", help="reuse this generated history database, it is created if it does not exist")
+    run_benchmarks(parser.parse_args())
@@ -1,122 +1,245 @@
-import sqlite3
+"""
+Migrates a TinyDB archive (games_db.json) into the SQLite database of the bot.
+
+The JSON file is parsed incrementally, one document at a time, so archives larger than the memory
+can be migrated. The snapshots go through the normal write path (history.insert_snapshots) in
+chunks, which also fills the deduplicated game records, the snapshot metrics, the player sessions
+and the player name index in the same pass. Every chunk is committed together with a checkpoint,
+an interrupted migration continues after the last committed document when it is started again.
+
+The TinyDB has three tables:
+1. Default table (_default): Game data with timestamp and games list
+2. reminders: Discord reminders with discord_id and names list
+3. avg_hourly_player_count: Average player count per hour with timestamp and average_players
+
+    python database_migration.py [games_db.json] [games_db.sqlite] [--no-rollups]
+"""
+
+import argparse
 import json
-from tinydb import TinyDB
+import os
+import sqlite3
 from tqdm import tqdm
+import db
+import history
 
-def migrate_tinydb_to_sqlite(tinydb_path, sqlite_path):
+# indexes that are only needed by queries, they are dropped during the load and built once at the end
+DEFERRED_INDEXES = [
+    "idx_games_timestamp_metrics",
+    "idx_game_records_last_seen",
+    "idx_player_sessions_name",
+    "idx_player_names_search_key",
+    "idx_player_names_last_seen",
+]
+
+
+class TinyDBReader:
     """
-    Migrate TinyDB database to SQLite3.
-    
-    The TinyDB has three tables:
-    1. Default table (_default): Game data with timestamp and games list
-    2. reminders: Discord reminders with discord_id and names list
-    3. avg_hourly_player_count: Average player count per hour with timestamp and average_players
+    Streams the documents of a TinyDB json file as (table, doc_id, document).
+
+    TinyDB writes {"table": {"doc_id": document, ...}, ...}, the reader only keeps the current
+    document and the unparsed rest of the last chunk in memory.
     """
-    
-    # Connect to TinyDB
-    db = TinyDB(tinydb_path)
-    
-    # Connect to SQLite3
-    conn = sqlite3.connect(sqlite_path)
-    cursor = conn.cursor()
-    
-    # Create games table for the default table data
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS games (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp INTEGER NOT NULL,
-            games_data TEXT NOT NULL
-        )
-    ''')
-    
-    # Create reminders table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reminders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id INTEGER NOT NULL UNIQUE,
-            names TEXT NOT NULL
-        )
-    ''')
-    
-    # Create avg_hourly_player_count table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS avg_hourly_player_count (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp INTEGER NOT NULL UNIQUE,
-            average_players REAL NOT NULL
+
+    def __init__(self, f, chunk_size: int = 1 << 20, progress=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read_chunk(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.progress is not None:
+            self.progress.update(len(chunk.encode("utf-8")))
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _peek(self) -> str:
+        # next character after whitespace, "" at the end of the file
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read_chunk():
+                return ""
+
+    def _expect(self, character: str):
+        if self._peek() != character:
+            raise ValueError(f"Expected {character!r} at offset {self.position} of the current chunk.")
+        self.position += 1
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # the value continues in the next chunk
+                if not self._read_chunk():
+                    raise
+                continue
+            self.position = end
+            return value
+
+    def _iter_object(self):
+        # yields the keys of an object one at a time, the caller reads each value before the next key
+        self._expect("{")
+        if self._peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            yield key
+
+            if self._peek() == ",":
+                self.position += 1
+            else:
+                self._expect("}")
+                return
+
+    def __iter__(self):
+        if self._peek() == "":
+            return
+        for table in self._iter_object():
+            for doc_id in self._iter_object():
+                yield table, int(doc_id), self._decode()
+
+
+def ensure_migration_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_checkpoints (
+            source_table TEXT PRIMARY KEY,
+            last_doc_id INTEGER NOT NULL
         )
     ''')
-    
-    # Create indexes for better query performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_timestamp ON games(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reminders_discord_id ON reminders(discord_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_avg_timestamp ON avg_hourly_player_count(timestamp)')
-    
-    # Migrate default table (games data)
-    default_table = db.table('_default')
-    games_data = default_table.all()
-    games_count = 0
-    
-    print("Migrating default table (games data)...")
-    for entry in tqdm(games_data, desc="Games", unit="entry"):
-        timestamp = entry.get('timestamp')
-        games = entry.get('games', [])
-        # Store games as JSON string
-        games_json = json.dumps(games)
-        
-        cursor.execute('''
-            INSERT INTO games (timestamp, games_data) VALUES (?, ?)
-        ''', (timestamp, games_json))
-        games_count += 1
-    
-    # Migrate reminders table
-    reminders_table = db.table('reminders')
-    reminders_data = reminders_table.all()
-    reminders_count = 0
-    
-    print("\nMigrating reminders table...")
-    for entry in tqdm(reminders_data, desc="Reminders", unit="entry"):
-        discord_id = entry.get('discord_id')
-        names = entry.get('names', [])
-        # Store names as JSON string
-        names_json = json.dumps(names)
-        
-        cursor.execute('''
-            INSERT INTO reminders (discord_id, names) VALUES (?, ?)
-        ''', (discord_id, names_json))
-        reminders_count += 1
-    
-    # # Migrate avg_hourly_player_count table
-    # print("Migrating avg_hourly_player_count table...")
-    # avg_table = db.table('avg_hourly_player_count')
-    # avg_count = 0
-    # for entry in avg_table.all():
-    #     timestamp = entry.get('timestamp')
-    #     average_players = entry.get('average_players')
-        
-    #     cursor.execute('''
-    #         INSERT INTO avg_hourly_player_count (timestamp, average_players) VALUES (?, ?)
-    #     ''', (timestamp, average_players))
-    #     avg_count += 1
-    
-    # print(f"Migrated {avg_count} average player count entries.")
-    
-    # Commit changes and close connections
     conn.commit()
+
+
+def get_checkpoints(conn: sqlite3.Connection) -> dict[str, int]:
+    return dict(conn.execute('SELECT source_table, last_doc_id FROM migration_checkpoints').fetchall())
+
+
+def save_checkpoint(conn: sqlite3.Connection, table: str, doc_id: int):
+    conn.execute('INSERT OR REPLACE INTO migration_checkpoints (source_table, last_doc_id) VALUES (?, ?)', (table, doc_id))
+
+
+def migrate_tinydb_to_sqlite(tinydb_path, sqlite_path, chunk_size: int = 1000, run_rollups: bool = True) -> dict[str, int]:
+    """
+    Migrate TinyDB database to SQLite3, returns the number of migrated documents per table.
+
+    With run_rollups the hourly and daily rollups are built right away and the hourly averages of
+    the TinyDB fill the hours without snapshots.
+    """
+    conn = db.connect(sqlite_path)
+    try:
+        # bulk load settings, a crash of the process loses at most the current chunk
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA cache_size=-262144')  # 256 MB
+
+        resuming = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'migration_checkpoints'").fetchone() is not None
+        if not resuming:
+            db.ensure_schema(conn)
+            ensure_migration_schema(conn)
+        for index in DEFERRED_INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {index}')
+        conn.commit()
+
+        checkpoints = get_checkpoints(conn)
+        if resuming:
+            print(f"Resuming the migration after documents {checkpoints}.")
+
+        counts = {"_default": 0, "reminders": 0, "avg_hourly_player_count": 0}
+        skipped = 0
+        # documents read since the last commit
+        pending_snapshots = []
+        pending_reminders = []
+        legacy_averages = []
+        last_doc_ids = {}
+
+        def commit_chunk():
+            history.insert_snapshots(conn, pending_snapshots)
+            conn.executemany('INSERT OR IGNORE INTO reminder_names (name_lower, discord_id) VALUES (?, ?)', pending_reminders)
+            for table, doc_id in last_doc_ids.items():
+                save_checkpoint(conn, table, doc_id)
+            conn.commit()
+            pending_snapshots.clear()
+            pending_reminders.clear()
+            last_doc_ids.clear()
+
+        with open(tinydb_path, encoding="utf-8") as f, \
+                tqdm(total=os.path.getsize(tinydb_path), desc="Migrating", unit="B", unit_scale=True) as progress:
+            for table, doc_id, document in TinyDBReader(f, progress=progress):
+                if doc_id <= checkpoints.get(table, 0):
+                    continue
+
+                if table == "_default":
+                    timestamp = document.get("timestamp")
+                    if timestamp is None:
+                        skipped += 1
+                        continue
+                    pending_snapshots.append((int(timestamp), document.get("games", [])))
+                elif table == "reminders":
+                    pending_reminders.extend((name.lower(), document.get("discord_id")) for name in document.get("names", []))
+                elif table == "avg_hourly_player_count":
+                    # copied after the rollups, so the hours rolled up from snapshots win; not checkpointed,
+                    # an interrupted migration reads them again
+                    legacy_averages.append((document.get("timestamp"), document.get("average_players")))
+                    counts[table] += 1
+                    continue
+                else:
+                    continue
+                counts[table] += 1
+                last_doc_ids[table] = doc_id
+
+                if len(pending_snapshots) >= chunk_size or len(pending_reminders) >= chunk_size:
+                    commit_chunk()
+            commit_chunk()
+
+        print("Building indexes...")
+        conn.execute('PRAGMA synchronous=NORMAL')
+        db.ensure_schema(conn)
+
+        if run_rollups:
+            print("Building rollups...")
+            history.update_rollups(conn)
+            conn.executemany(f'INSERT OR IGNORE INTO {history.ROLLUP_TABLES[history.HOUR]} (timestamp, average_players) VALUES (?, ?)',
+                             [(timestamp, average) for timestamp, average in legacy_averages
+                              if timestamp is not None and average is not None])
+            conn.commit()
+
+        conn.execute('PRAGMA optimize')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
     print("\nMigration completed successfully!")
     print(f"Total entries migrated:")
-    print(f"  - Games: {games_count}")
-    print(f"  - Reminders: {reminders_count}")
-    
-    conn.close()
-    db.close()
+    print(f"  - Games: {counts['_default']}" + (f" ({skipped} without timestamp skipped)" if skipped else ""))
+    print(f"  - Reminders: {counts['reminders']}")
+    print(f"  - Average player counts: {counts['avg_hourly_player_count']}")
+    return counts
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrate the TinyDB archive into the SQLite database.")
+    parser.add_argument("tinydb_path", nargs="?", default="games_db.json")
+    parser.add_argument("sqlite_path", nargs="?", default="games_db.sqlite")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="documents per transaction")
+    parser.add_argument("--no-rollups", action="store_true", help="leave the rollups to the bot")
+    args = parser.parse_args()
+
     # Run the migration
-    tinydb_path = 'games_db.json'
-    sqlite_path = 'games_db.sqlite'
-    
-    print(f"Starting migration from {tinydb_path} to {sqlite_path}...")
-    migrate_tinydb_to_sqlite(tinydb_path, sqlite_path)
-    print(f"\nDatabase migrated to {sqlite_path}")
\ No newline at end of file
+    print(f"Starting migration from {args.tinydb_path} to {args.sqlite_path}...")
+    migrate_tinydb_to_sqlite(args.tinydb_path, args.sqlite_path, args.chunk_size, run_rollups=not args.no_rollups)
+    print(f"\nDatabase migrated to {args.sqlite_path}")
@@ -0,0 +1,126 @@
+import asyncio
+import concurrent.futures
+import sqlite3
+import threading
+import logging
+import history
+import metrics
+import overviews
+import reminders
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'games_db.sqlite'
+
+# all writes go through one thread, reads are spread over a small pool
+# every thread keeps its own long-lived connection
+_db_path: str = DB_PATH
+_writer: concurrent.futures.ThreadPoolExecutor | None = None
+_readers: concurrent.futures.ThreadPoolExecutor | None = None
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
+query_seconds = metrics.Histogram("bot_db_query_seconds", "Duration of database calls, including the commit of writes.")
+
+
+def connect(path: str = DB_PATH) -> sqlite3.Connection:
+    # the connection is only used by the thread that created it, it is closed from the main thread on shutdown
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=256)
+    # WAL lets readers run while the writer thread inserts snapshots
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-32000')  # 32 MB
+    conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    return conn
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection):
+    # auto_vacuum can only be switched on an existing database by rebuilding it once
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        logger.info("Switching the database to auto_vacuum=INCREMENTAL, this rebuilds the database once...")
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = 1000) -> int:
+    # gives up to `pages` free pages back to the file system, returns the number of free pages left
+    # sqlite3 steps a pragma without result rows only once, which frees a single page, executescript runs it to the end
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            discord_id INTEGER NOT NULL UNIQUE,
+            names TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    reminders.ensure_schema(conn)
+    overviews.ensure_schema(conn)
+    history.ensure_schema(conn)
+
+
+def _get_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = connect(_db_path)
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def _run_read(fn, *args):
+    with query_seconds.time(kind="read", query=fn.__name__):
+        return fn(_get_connection(), *args)
+
+
+def _run_write(fn, *args):
+    conn = _get_connection()
+    with query_seconds.time(kind="write", query=fn.__name__):
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init(path: str = DB_PATH, reader_threads: int = 2, use_incremental_vacuum: bool = False):
+    # opens the database, migrates the schema on the writer thread and blocks until it is done
+    global _db_path, _writer, _readers
+    _db_path = path
+    _writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+    _readers = concurrent.futures.ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix="db-reader")
+    if use_incremental_vacuum:
+        _writer.submit(_run_read, enable_incremental_vacuum).result()
+    _writer.submit(_run_write, ensure_schema).result()
+    logger.info(f"Opened database {path} with {reader_threads} reader threads.")
+
+
+async def read(fn, *args):
+    """Run `fn(conn, *args)` on a reader thread and return its result."""
+    return await asyncio.get_running_loop().run_in_executor(_readers, _run_read, fn, *args)
+
+
+async def write(fn, *args):
+    """Run `fn(conn, *args)` on the writer thread inside a transaction and return its result."""
+    return await asyncio.get_running_loop().run_in_executor(_writer, _run_write, fn, *args)
+
+
+def close():
+    global _writer, _readers
+    for executor in (_writer, _readers):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _writer = _readers = None
+
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
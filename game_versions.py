@@ -0,0 +1,50 @@
+import functools
+import re
+from typing import NamedTuple
+from packaging import version
+
+NORMAL = "normal"
+DEVTEST = "devtest"
+PRERELEASE = "prerelease"
+# versions with letters that are neither devtests nor prereleases, they are not shown in the overview
+LEGACY = "legacy"
+
+
+class VersionInfo(NamedTuple):
+    name: str  # version string without the leading 'v' of really old CA versions
+    tag: str
+    parsed: version.Version | None  # only set for normal versions
+
+
+def has_letters(s: str) -> bool:
+    return re.search('[a-zA-Z]', s) != None
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_version(version_str: str) -> version.Version:
+    return version.parse(version_str)
+
+
+@functools.lru_cache(maxsize=1024)
+def classify_version(version_str: str) -> VersionInfo:
+    """
+    Normalize and tag a version string of a game.
+
+    Cached, since the same few versions show up in every snapshot. The games themselves are never
+    modified, renderers use VersionInfo.name instead of the raw version.
+    """
+    # for really old version of CA, remove the initial 'v'
+    name = version_str[1:] if version_str[:1] == 'v' else version_str
+    lower_name = name.lower()
+
+    if "dev" in lower_name:
+        return VersionInfo(name, DEVTEST, None)
+    if "pre" in lower_name:
+        return VersionInfo(name, PRERELEASE, None)
+    if has_letters(name):
+        return VersionInfo(name, LEGACY, None)
+
+    try:
+        return VersionInfo(name, NORMAL, parse_version(name))
+    except version.InvalidVersion:
+        return VersionInfo(name, LEGACY, None)
@@ -0,0 +1,300 @@
+import datetime
+import sqlite3
+import logging
+import player_names
+import player_sessions
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+# period name -> (bucket size in seconds, number of buckets)
+STATS_PERIODS = {
+    "day": (HOUR, 24),
+    "week": (HOUR, 168),
+    "month": (DAY, 30),
+    "year": (DAY, 365),
+}
+
+# bucket size -> rollup table holding the closed buckets of that size
+ROLLUP_TABLES = {
+    HOUR: "avg_hourly_player_count",
+    DAY: "avg_daily_player_count",
+}
+
+# derived per-snapshot columns of the games table, filled by save_data_to_db and the backfill
+SNAPSHOT_METRICS = ["total_players", "active_games", "human_clients", "waiting_games", "playing_games"]
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER NOT NULL,
+            games_data TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute('PRAGMA table_info(games)')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for column in SNAPSHOT_METRICS:
+        if column not in existing_columns:
+            cursor.execute(f'ALTER TABLE games ADD COLUMN {column} INTEGER')
+
+    snapshot_store.ensure_schema(conn)
+
+    # covering index, so range scans over the metrics never touch the games_data blobs
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_games_timestamp_metrics ON games(timestamp, {", ".join(SNAPSHOT_METRICS)})')
+
+    for table in ROLLUP_TABLES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL UNIQUE,
+                average_players REAL NOT NULL
+            )
+        ''')
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        for column in ["min_players", "max_players", "sample_count"]:
+            if column not in existing_columns:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER')
+
+    # end (exclusive) of the last bucket that has been rolled up, per rollup table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            rollup_table TEXT PRIMARY KEY,
+            watermark INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+
+    backfill_snapshot_metrics(conn)
+    player_sessions.ensure_schema(conn)
+    player_names.ensure_schema(conn)
+
+
+def compute_snapshot_metrics(games: list[dict]) -> tuple[int, int, int, int, int]:
+    # same order as SNAPSHOT_METRICS
+    total_players = sum(game.get("players", 0) for game in games)
+    active_games = sum(1 for game in games if game.get("players", 0) > 0)
+    human_clients = sum(1 for game in games for client in game.get("clients", []) if not client.get("isbot", False))
+    waiting_games = sum(1 for game in games if game.get("state", 0) == 1)
+    playing_games = sum(1 for game in games if game.get("state", 0) == 2)
+    return total_players, active_games, human_clients, waiting_games, playing_games
+
+
+def insert_snapshot(conn: sqlite3.Connection, timestamp: int, games: list[dict]):
+    # the games go to the deduplicated game_records, the derived numbers are stored in the row itself
+    # so history queries never have to read the games
+    insert_snapshots(conn, [(timestamp, games)])
+
+
+def insert_snapshots(conn: sqlite3.Connection, snapshots: list[tuple[int, list[dict]]], skip_existing: bool = False) -> int:
+    # inserts a batch of (timestamp, games) with one executemany, returns the number of inserted snapshots
+    if skip_existing:
+        # used when a batch may already have been written before a crash
+        snapshots = [(timestamp, games) for timestamp, games in snapshots
+                     if conn.execute('SELECT 1 FROM games WHERE timestamp = ? LIMIT 1', (timestamp,)).fetchone() is None]
+    game_rows = snapshot_store.store_game_records_batch(conn, snapshots)
+    conn.executemany(f'INSERT INTO games (timestamp, games_data, game_hashes, game_volatile, {", ".join(SNAPSHOT_METRICS)}) '
+                     f'VALUES (?, \'\', ?, ?, ?, ?, ?, ?, ?)',
+                     [(timestamp, hashes, volatile, *compute_snapshot_metrics(games))
+                      for (timestamp, games), (hashes, volatile) in zip(snapshots, game_rows)])
+    # in the same transaction, so the sessions never miss or repeat a snapshot
+    player_sessions.update_sessions(conn, snapshots)
+    player_names.update_names(conn, snapshots)
+    return len(snapshots)
+
+
+def backfill_snapshot_metrics(conn: sqlite3.Connection, batch_size: int = 10000) -> int:
+    # one-time fill of the metrics columns for snapshots written before they existed
+    cursor = conn.cursor()
+    reader = snapshot_store.SnapshotReader(conn)
+    assignments = ", ".join(f"{column} = ?" for column in SNAPSHOT_METRICS)
+    backfilled = 0
+    while True:
+        cursor.execute('SELECT id, games_data, game_hashes FROM games WHERE total_players IS NULL LIMIT ?', (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        cursor.executemany(f'UPDATE games SET {assignments} WHERE id = ?',
+                           [(*compute_snapshot_metrics(reader.decode(games_data, game_hashes)), row_id)
+                            for row_id, games_data, game_hashes in rows])
+        conn.commit()
+        backfilled += len(rows)
+        logger.info(f"Backfilled snapshot metrics for {backfilled} games entries.")
+    return backfilled
+
+
+def get_bucket_start(timestamp: int, bucket_seconds: int) -> int:
+    # buckets are aligned to UTC, so hours start at :00 and days at midnight UTC
+    return timestamp - timestamp % bucket_seconds
+
+
+def query_player_count_buckets(conn: sqlite3.Connection, start_timestamp: int, end_timestamp: int,
+                               bucket_seconds: int) -> list[tuple[int, float, int, int, int]]:
+    # (bucket index, average, min, max, sample count) for every bucket in the range that has snapshots
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT (timestamp - ?) / ? AS bucket, AVG(total_players), MIN(total_players), MAX(total_players), COUNT(*)
+        FROM games
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY bucket
+    ''', (start_timestamp, bucket_seconds, start_timestamp, end_timestamp))
+    return cursor.fetchall()
+
+
+def get_average_player_count_buckets(conn: sqlite3.Connection, start_timestamp: int, bucket_seconds: int,
+                                     bucket_count: int) -> list[float | None]:
+    """
+    Average total player count for `bucket_count` consecutive buckets starting at `start_timestamp`.
+
+    All buckets are computed with a single range scan over the timestamp/metrics index of the
+    games table, the games_data JSON is not read. Buckets without any snapshot are returned
+    as None so callers can tell gaps apart from empty servers.
+    """
+    end_timestamp = start_timestamp + bucket_seconds * bucket_count
+
+    averages: list[float | None] = [None] * bucket_count
+    for bucket, average, _, _, _ in query_player_count_buckets(conn, start_timestamp, end_timestamp, bucket_seconds):
+        averages[bucket] = average
+    return averages
+
+
+def get_rollup_watermark(conn: sqlite3.Connection, table: str) -> int | None:
+    cursor = conn.cursor()
+    cursor.execute('SELECT watermark FROM rollup_watermarks WHERE rollup_table = ?', (table,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def update_rollups(conn: sqlite3.Connection, now: datetime.datetime | None = None) -> dict[str, int]:
+    """
+    Incrementally roll up all closed hours and days since the last run into the rollup tables.
+
+    Every table resumes from its watermark in rollup_watermarks; on the first run it starts after the
+    newest existing rollup row or, for an empty table, at the oldest snapshot. Returns the number of
+    buckets written per table.
+    """
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    cursor = conn.cursor()
+    inserted_entries = {}
+    for bucket_seconds, table in ROLLUP_TABLES.items():
+        watermark = get_rollup_watermark(conn, table)
+        if watermark is None:
+            cursor.execute(f'SELECT MAX(timestamp) FROM {table}')
+            newest_rollup = cursor.fetchone()[0]
+            if newest_rollup is not None:
+                watermark = newest_rollup + bucket_seconds
+            else:
+                cursor.execute('SELECT MIN(timestamp) FROM games')
+                oldest_snapshot = cursor.fetchone()[0]
+                if oldest_snapshot is None:
+                    inserted_entries[table] = 0
+                    continue
+                watermark = get_bucket_start(oldest_snapshot, bucket_seconds)
+
+        # only closed buckets are rolled up, the current one is still filling
+        end_timestamp = get_bucket_start(int(now.timestamp()), bucket_seconds)
+        if end_timestamp <= watermark:
+            inserted_entries[table] = 0
+            continue
+
+        rows = query_player_count_buckets(conn, watermark, end_timestamp, bucket_seconds)
+        cursor.executemany(f'''
+            INSERT OR REPLACE INTO {table} (timestamp, average_players, min_players, max_players, sample_count)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(watermark + bucket * bucket_seconds, average, minimum, maximum, count)
+              for bucket, average, minimum, maximum, count in rows])
+        cursor.execute('INSERT OR REPLACE INTO rollup_watermarks (rollup_table, watermark) VALUES (?, ?)',
+                       (table, end_timestamp))
+        conn.commit()
+        inserted_entries[table] = len(rows)
+
+    return inserted_entries
+
+
+def get_retention_cutoff(conn: sqlite3.Connection, retention_days: float, now: datetime.datetime | None = None) -> int:
+    # raw snapshots before this timestamp can be deleted, it never passes a rollup watermark
+    # so only ranges that are fully covered by the hourly and daily rollups are dropped
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    cutoff = int(now.timestamp() - retention_days * DAY)
+    for table in ROLLUP_TABLES.values():
+        watermark = get_rollup_watermark(conn, table)
+        cutoff = min(cutoff, watermark if watermark is not None else 0)
+    return cutoff
+
+
+def prune_raw_snapshots(conn: sqlite3.Connection, cutoff: int, batch_size: int = 5000) -> int:
+    """
+    Delete up to `batch_size` of the oldest snapshots before `cutoff` and return how many were deleted.
+
+    Once no snapshot before the cutoff is left, the game records only used by the deleted snapshots
+    are removed in batches as well. Small batches keep every write transaction short.
+    """
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM games WHERE id IN (SELECT id FROM games WHERE timestamp < ? ORDER BY timestamp LIMIT ?)',
+                   (cutoff, batch_size))
+    deleted = cursor.rowcount
+    if deleted < batch_size:
+        deleted += snapshot_store.delete_unused_game_records(conn, cutoff, batch_size - deleted)
+    return deleted
+
+
+def get_series_watermark(conn: sqlite3.Connection, period: str,
+                         now: datetime.datetime | None = None) -> tuple[int | None, int]:
+    # changes whenever the series of the period changes bucket-wise: a rollup ran or a new bucket started
+    bucket_seconds, _ = STATS_PERIODS[period]
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    table = ROLLUP_TABLES.get(bucket_seconds)
+    watermark = get_rollup_watermark(conn, table) if table else None
+    return watermark, get_bucket_start(int(now.timestamp()), bucket_seconds)
+
+
+def get_average_player_count_series(conn: sqlite3.Connection, period: str,
+                                    now: datetime.datetime | None = None) -> tuple[list[datetime.datetime], list[float | None]]:
+    """
+    Dense series of average player counts for a stats period ("day", "week", "month" or "year").
+
+    Returns the UTC start of every bucket (oldest first, the last one being the current, partial
+    bucket) together with the average player count of that bucket or None if there is no data.
+    Closed buckets are read from the rollup tables, only buckets after the rollup watermark are
+    computed from the raw snapshots.
+    """
+    bucket_seconds, bucket_count = STATS_PERIODS[period]
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    current_bucket = get_bucket_start(int(now.timestamp()), bucket_seconds)
+    start_timestamp = current_bucket - bucket_seconds * (bucket_count - 1)
+    end_timestamp = current_bucket + bucket_seconds
+
+    averages: list[float | None] = [None] * bucket_count
+    raw_start_timestamp = start_timestamp
+
+    table = ROLLUP_TABLES.get(bucket_seconds)
+    watermark = get_rollup_watermark(conn, table) if table else None
+    if watermark is not None and watermark > start_timestamp:
+        raw_start_timestamp = min(watermark, end_timestamp)
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT timestamp, average_players FROM {table} WHERE timestamp >= ? AND timestamp < ?',
+                       (start_timestamp, raw_start_timestamp))
+        for timestamp, average in cursor.fetchall():
+            averages[(timestamp - start_timestamp) // bucket_seconds] = average
+
+    raw_offset = (raw_start_timestamp - start_timestamp) // bucket_seconds
+    averages[raw_offset:] = get_average_player_count_buckets(conn, raw_start_timestamp, bucket_seconds,
+                                                            bucket_count - raw_offset)
+
+    bucket_times = [datetime.datetime.fromtimestamp(start_timestamp + i * bucket_seconds, tz=datetime.timezone.utc)
+                    for i in range(bucket_count)]
+    return bucket_times, averages
@@ -0,0 +1,392 @@
+"""
+End-to-end load harness with local stand-ins for the master server and the Discord API.
+
+The fake master server serves a scripted game list that changes on every request. The fake Discord
+API answers the REST routes the bot uses (overview edits, DMs, interaction responses and followups),
+records every call and answers with 429s once a route is used faster than its rate limit. discord.py
+is pointed at it through Route.BASE, so the real request and rate limit handling of the library is
+part of the measurement. Presence updates would go over the gateway and are only recorded.
+
+The bot's update cycle runs back to back instead of every 30 seconds, with thousands of reminders
+and concurrent /stats and /games invocations, and the harness reports tick latency, command
+latency percentiles and the API calls per route. Snapshots are stamped with the simulated time of
+the tick. Command errors and snapshots that could not be written fail the run with exit code 1.
+
+    python load_harness.py [--ticks 200] [--reminders 5000] [--commands-per-tick 4] [--history-days 30]
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import discord
+from aiohttp import web
+
+import benchmark
+import db
+import history
+import main
+import master_server
+import overviews
+import rendering
+import snapshot_buffer
+
+BOT_ID = 100
+APPLICATION_ID = 101
+COMMAND_CHANNEL_ID = 200
+OVERVIEW_CHANNEL_ID = 300  # first of the subscribed overview channels
+OVERVIEW_MESSAGE_ID = 10 ** 8
+DM_CHANNEL_OFFSET = 10 ** 6
+TICK_SECONDS = 30  # bot time covered by one tick
+
+
+def user_payload(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None, "global_name": None}
+
+
+def message_payload(channel_id: int, message_id: int, embeds: list | None = None) -> dict:
+    return {
+        "id": str(message_id), "channel_id": str(channel_id), "author": user_payload(BOT_ID), "content": "",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(), "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": embeds or [], "pinned": False, "type": 0,
+    }
+
+
+def json_response(payload, status: int = 200, headers: dict | None = None) -> web.Response:
+    # discord.py only decodes bodies with exactly "application/json", without a charset
+    return web.Response(body=json.dumps(payload).encode(), status=status, headers=headers, content_type="application/json")
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class FakeMasterServer:
+    """Serves the game list of all mods, a part of the games changes between two requests."""
+
+    def __init__(self, mods: int, games: int, clients: int, player_names: list[str], seed: int = 0):
+        self.rng = random.Random(seed)
+        self.clients = clients
+        self.player_names = player_names
+        self.games = benchmark.generate_games(mods, games, clients, seed, player_names)
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def evolve(self):
+        # players join and leave a few games, like between two polls of the real server
+        for game in self.rng.sample(self.games, max(1, len(self.games) // 20)):
+            names = self.rng.sample(self.player_names, self.rng.randint(0, self.clients))
+            game["clients"] = [{"name": name, "isbot": False, "team": i % 2 + 1, "isspectator": False}
+                               for i, name in enumerate(names)]
+            game["players"] = len(names)
+            game["state"] = self.rng.choice([1, 2])
+
+    async def handle_games(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.evolve()
+        body = json.dumps(self.games).encode()
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/games", self.handle_games)
+        return app
+
+
+class RateLimit:
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.window_start = 0.0
+        self.used = 0
+
+    def retry_after(self) -> float:
+        # 0 if the request may pass, otherwise the seconds until the window resets
+        now = time.monotonic()
+        if now - self.window_start >= self.per:
+            self.window_start = now
+            self.used = 0
+        if self.used < self.limit:
+            self.used += 1
+            return 0.0
+        return self.per - (now - self.window_start)
+
+
+class FakeDiscord:
+    """Records the REST calls of the bot and enforces simple per-route rate limits."""
+
+    def __init__(self, latency: float = 0.0, dm_limit: int = 50, edit_limit: int = 5, rate_limit_window: float = 0.2):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.rate_limited = collections.Counter()
+        self.bytes_received = 0
+        self.presence_updates = 0
+        self.dms: list[tuple[int, str]] = []
+        self.dm_channels: dict[int, int] = {}
+        self.next_message_id = 10 ** 9
+        # like discord, the limits apply per channel
+        self.limits = {"POST /channels/{id}/messages": (dm_limit, rate_limit_window),
+                       "PATCH /channels/{id}/messages/{id}": (edit_limit, rate_limit_window)}
+        self.buckets: dict[tuple[str, str], RateLimit] = {}
+
+    async def change_presence(self, *, activity=None, status=None):
+        # stands in for the gateway, presence updates do not use the REST api
+        self.presence_updates += 1
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v10/users/@me", self.handle_me)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.handle_application)
+        app.router.add_get("/api/v10/users/{user_id}", self.handle_user)
+        app.router.add_post("/api/v10/users/@me/channels", self.handle_create_dm)
+        app.router.add_post("/api/v10/channels/{channel_id}/messages", self.handle_send_message)
+        app.router.add_patch("/api/v10/channels/{channel_id}/messages/{message_id}", self.handle_edit_message)
+        app.router.add_post("/api/v10/interactions/{interaction_id}/{token}/callback", self.handle_interaction_callback)
+        app.router.add_post("/api/v10/webhooks/{application_id}/{token}", self.handle_followup)
+        return app
+
+    async def respond(self, route: str, request: web.Request, payload) -> web.Response:
+        self.calls[route] += 1
+        self.bytes_received += len(await request.read())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        retry_after = 0.0
+        if route in self.limits:
+            key = (route, request.match_info.get("channel_id", ""))
+            if key not in self.buckets:
+                self.buckets[key] = RateLimit(*self.limits[route])
+            retry_after = self.buckets[key].retry_after()
+        if retry_after:
+            self.rate_limited[route] += 1
+            # the Via header marks the 429 as coming from the api instead of cloudflare
+            return json_response({"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+                                 status=429, headers={"Via": "1.1 google", "Retry-After": f"{retry_after:.3f}"})
+        return json_response(payload)
+
+    async def handle_me(self, request):
+        return await self.respond("GET /users/@me", request, user_payload(BOT_ID))
+
+    async def handle_application(self, request):
+        return await self.respond("GET /oauth2/applications/@me", request, {
+            "id": str(APPLICATION_ID), "name": "bot", "description": "", "icon": None, "bot_public": False,
+            "bot_require_code_grant": False, "owner": user_payload(1), "verify_key": "", "flags": 0, "summary": ""})
+
+    async def handle_user(self, request):
+        return await self.respond("GET /users/{id}", request, user_payload(int(request.match_info["user_id"])))
+
+    async def handle_create_dm(self, request):
+        recipient_id = int((await request.json())["recipient_id"])
+        self.dm_channels[recipient_id + DM_CHANNEL_OFFSET] = recipient_id
+        return await self.respond("POST /users/@me/channels", request, {
+            "id": str(recipient_id + DM_CHANNEL_OFFSET), "type": 1, "recipients": [user_payload(recipient_id)],
+            "last_message_id": None})
+
+    async def handle_send_message(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        response = await self.respond("POST /channels/{id}/messages", request, message_payload(channel_id, self.next_message_id))
+        if response.status == 200:
+            self.next_message_id += 1
+            self.dms.append((self.dm_channels.get(channel_id, 0), (await request.json()).get("content", "")))
+        return response
+
+    async def handle_edit_message(self, request):
+        embeds = (await request.json()).get("embeds")
+        return await self.respond("PATCH /channels/{id}/messages/{id}", request, message_payload(
+            int(request.match_info["channel_id"]), int(request.match_info["message_id"]), embeds))
+
+    async def handle_interaction_callback(self, request):
+        return await self.respond("POST /interactions/{id}/{token}/callback", request, {
+            "interaction": {"id": request.match_info["interaction_id"], "type": 2, "response_message_loading": True}})
+
+    async def handle_followup(self, request):
+        self.next_message_id += 1
+        return await self.respond("POST /webhooks/{id}/{token}", request, message_payload(COMMAND_CHANNEL_ID, self.next_message_id))
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.tick_latencies: list[float] = []
+        self.command_latencies: dict[str, list[float]] = collections.defaultdict(list)
+        self.command_errors = collections.Counter()
+        self.next_interaction_id = 5 * 10 ** 9
+        # simulated wall clock of the ticks, the persist job stamps the snapshots with it
+        self.clock = 0.0
+        self.last_persist_slot = None
+        self.flush_failures_before = snapshot_buffer.flush_failures.get()
+        self.dropped_snapshots_before = snapshot_buffer.dropped_snapshots.get()
+
+    def create_interaction(self, command: str) -> discord.Interaction:
+        self.next_interaction_id += 1
+        user = user_payload(self.rng.randint(10 ** 5, 10 ** 6))
+        return discord.Interaction(data={
+            "id": str(self.next_interaction_id), "application_id": str(APPLICATION_ID), "type": 2,
+            "token": f"token{self.next_interaction_id}", "version": 1, "attachment_size_limit": 25 * 2 ** 20,
+            "channel": {"id": str(COMMAND_CHANNEL_ID), "type": 1, "recipients": [user]},
+            "user": user, "data": {"id": "1", "name": command, "type": 1}, "locale": "en-US",
+        }, state=main.bot._connection)
+
+    async def run_command(self, command: str):
+        interaction = self.create_interaction(command)
+        start = time.perf_counter()
+        try:
+            if command == "stats":
+                await main.stats.callback(interaction, period=self.rng.choice(list(history.STATS_PERIODS)),
+                                          timezone=self.rng.choice(["UTC", "Europe/Berlin", "America/New_York"]))
+            else:
+                await main.games.callback(interaction, outdated=self.rng.random() < 0.3, empty=self.rng.random() < 0.3)
+        except Exception as e:
+            self.command_errors[f"{command}: {type(e).__name__}"] += 1
+            return
+        self.command_latencies[command].append(time.perf_counter() - start)
+
+    async def tick(self):
+        # the scheduled jobs of one 30 second slot, run back to back instead of on their boundaries
+        start = time.perf_counter()
+        await main.fetch_job()
+        persist_slot = self.clock // main.persist_interval
+        if persist_slot != self.last_persist_slot:
+            self.last_persist_slot = persist_slot
+            await main.persist_job(now=self.clock)
+        await main.publish_job()
+        await main.reminder_job()
+        self.tick_latencies.append(time.perf_counter() - start)
+        self.clock += TICK_SECONDS
+
+    async def run(self, master_url: str, discord_url: str, fake_discord: FakeDiscord, player_names: list[str]):
+        args = self.args
+        master_server.url = master_url
+        discord.http.Route.BASE = discord_url + "/api/v10"
+        main.bot.change_presence = fake_discord.change_presence
+
+        # reminders for random players, some of them come online while the harness runs
+        reminder_names = [(self.rng.choice(player_names).lower(), 10 ** 7 + i) for i in range(args.reminders)]
+        await db.write(lambda conn: conn.executemany(
+            'INSERT OR IGNORE INTO reminder_names (name_lower, discord_id) VALUES (?, ?)', reminder_names))
+        for i in range(args.overview_channels):
+            await db.write(overviews.add_subscription, OVERVIEW_CHANNEL_ID + i, None, OVERVIEW_MESSAGE_ID + i)
+
+        # runs the bot's setup_hook, which opens the sessions, starts the render pool and builds the reminder index
+        await main.bot.login("harness-token")
+
+        # starts after the generated history, in the next persist slot
+        self.clock = float((int(time.time()) // main.persist_interval + 1) * main.persist_interval)
+        commands = []
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            for _ in range(args.commands_per_tick):
+                commands.append(asyncio.create_task(self.run_command(self.rng.choice(["stats", "games"]))))
+            await self.tick()
+        await asyncio.gather(*commands)
+        try:
+            await snapshot_buffer.flush()
+        except Exception:
+            # already counted in flush_failures
+            pass
+        self.elapsed = time.perf_counter() - start
+
+    def report(self, fake_master: FakeMasterServer, fake_discord: FakeDiscord) -> int:
+        # returns the number of errors, the harness fails if there are any
+        simulated = len(self.tick_latencies) * TICK_SECONDS
+        print(f"\n{len(self.tick_latencies)} ticks ({simulated / 3600:.1f}h of bot time) in {self.elapsed:.1f}s, "
+              f"{simulated / self.elapsed:.0f}x real speed")
+        print(f"tick latency     p50 {percentile(self.tick_latencies, 50) * 1000:8.1f} ms   "
+              f"p99 {percentile(self.tick_latencies, 99) * 1000:8.1f} ms   max {max(self.tick_latencies) * 1000:8.1f} ms")
+        for command, latencies in sorted(self.command_latencies.items()):
+            print(f"/{command:<15} p50 {percentile(latencies, 50) * 1000:8.1f} ms   "
+                  f"p99 {percentile(latencies, 99) * 1000:8.1f} ms   ({len(latencies)} invocations)")
+        for error, count in self.command_errors.items():
+            print(f"command error    {error}: {count}")
+        flush_failures = int(snapshot_buffer.flush_failures.get() - self.flush_failures_before)
+        dropped_snapshots = int(snapshot_buffer.dropped_snapshots.get() - self.dropped_snapshots_before)
+        print(f"snapshot buffer: {flush_failures} failed flushes, {dropped_snapshots} dropped snapshots, "
+              f"{snapshot_buffer.get_pending_count()} not written")
+
+        print(f"\nmaster server: {fake_master.requests} requests, {fake_master.bytes_sent / 1e6:.1f} MB sent")
+        print(f"discord api: {sum(fake_discord.calls.values())} calls, {fake_discord.bytes_received / 1e6:.1f} MB received, "
+              f"{fake_discord.presence_updates} presence updates")
+        for route, count in fake_discord.calls.most_common():
+            print(f"  {route:<45} {count:6d} calls   {fake_discord.rate_limited[route]:5d} rate limited")
+        print(f"reminder DMs delivered: {len(fake_discord.dms)}, "
+              f"overview edits skipped: {main.overview_edits_skipped}, presence updates skipped: {main.presence_updates_skipped}")
+
+        errors = sum(self.command_errors.values()) + flush_failures + dropped_snapshots + snapshot_buffer.get_pending_count()
+        if errors:
+            print(f"\nFAILED: {errors} errors")
+        return errors
+
+
+async def run_harness(args):
+    player_names = benchmark.generate_player_names(args.players, args.seed)
+    fake_master = FakeMasterServer(args.mods, args.games, args.clients, player_names, args.seed)
+    fake_discord = FakeDiscord(latency=args.api_latency / 1000)
+    runners = [web.AppRunner(fake_master.make_app(), access_log=None),
+               web.AppRunner(fake_discord.make_app(), access_log=None)]
+    urls = []
+    for runner in runners:
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        urls.append(f"http://{host}:{port}")
+
+    harness = Harness(args)
+    try:
+        await harness.run(urls[0] + "/games", urls[1], fake_discord, player_names)
+        return harness.report(fake_master, fake_discord)
+    finally:
+        for task in asyncio.all_tasks():
+            # the bot's background tasks wait for a gateway connection that never comes
+            if task is not asyncio.current_task():
+                task.cancel()
+        await main.bot.close()
+        await master_server.close_session()
+        for runner in runners:
+            await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive the bot against local fakes of the master server and Discord.")
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--reminders", type=int, default=5000)
+    parser.add_argument("--overview-channels", type=int, default=20, help="number of subscribed overview messages")
+    parser.add_argument("--commands-per-tick", type=int, default=4)
+    parser.add_argument("--mods", type=int, default=5)
+    parser.add_argument("--games", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--players", type=int, default=3000, help="number of distinct player names")
+    parser.add_argument("--history-days", type=float, default=30, help="days of generated history for /stats")
+    parser.add_argument("--api-latency", type=float, default=0, help="milliseconds the fake Discord api waits per call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # the bot logs every command and DM, and discord.py every 429, which would drown the report
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("discord.http").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "harness.sqlite")
+        snapshot_buffer.journal_path = os.path.join(tmp_dir, "snapshot_journal.jsonl")
+        if args.history_days > 0:
+            benchmark.generate_history_db(db_path, years=args.history_days / 365, seed=args.seed)
+        db.init(db_path)
+        try:
+            errors = asyncio.run(run_harness(args))
+        finally:
+            rendering.shutdown()
+            db.close()
+    sys.exit(1 if errors else 0)
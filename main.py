@@ -1,35 +1,80 @@
 import discord
 from discord.ext import commands
-import aiohttp
-from packaging import version
 import asyncio
 import dotenv
 import os
 import datetime
-import sqlite3
-import json
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
-import matplotlib.dates as mdates
 from discord import app_commands
 import pytz
 import logging
-import re
+import hashlib
+import json
+import time
 
 
 dotenv.load_dotenv()
 
+# the local modules read their settings from the environment on import, so load the .env first
+import history
+import db
+import metrics
+import game_versions
+import master_server
+import overviews
+import player_names
+import player_sessions
+import rendering
+import reminders
+import scheduler
+import snapshot_buffer
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 intents = discord.Intents.default()
 intents.message_content = False
 
-url = "https://master.openra.net/games?protocol=2&type=json"
-mode_name = "ca"
-message_id: int = 0
-channel_id: int = 0
 task_iteration: int = 0
+# the jobs below run on fixed wall-clock boundaries of their interval, see scheduler.py
+fetch_interval: float = float(os.getenv("FETCH_INTERVAL", "30"))
+# optional faster polling while players are online and slower polling while nobody plays, default off
+active_fetch_interval: float = float(os.getenv("ACTIVE_FETCH_INTERVAL", str(fetch_interval)))
+idle_fetch_interval: float = float(os.getenv("IDLE_FETCH_INTERVAL", str(fetch_interval)))
+# seconds between two snapshots in the database, the hourly averages rely on this grid
+persist_interval: int = int(os.getenv("PERSIST_INTERVAL", "60"))
+publish_interval: int = 30 # seconds between two overview/presence updates
+reminder_interval: int = 30 # seconds between two reminder checks
+stage_offset: float = 2 # the consumers run this many seconds after the fetch boundary to see the new snapshot
+max_job_backoff: float = 300 # upper bound of the retry delay of a failing job
+max_reminder_attempts: int = 3
+reminder_semaphore = asyncio.Semaphore(10) # reminder DMs sent in parallel
+
+# the overview message and the presence are only updated on changes or after overview_max_age seconds
+overview_max_age: float = float(os.getenv("OVERVIEW_MAX_AGE", "300"))
+publish_report_interval: int = 120 # iterations between two reports of the skipped updates
+# per overview channel: digest and time of the last edit
+overview_digests: dict[int, str] = {}
+overview_edit_times: dict[int, float] = {}
+overview_semaphore = asyncio.Semaphore(5) # overview messages edited in parallel
+max_overview_failures: int = 3 # ticks in a row without access before a subscription is removed
+overview_failures: dict[int, int] = {}
+last_presence_name: str | None = None
+last_presence_update: float = 0
+overview_edits_skipped: int = 0
+presence_updates_skipped: int = 0
+rollup_delay: int = 60 # seconds to wait after an hour has closed before rolling it up
+# raw snapshots are kept this many days (0 keeps them forever), hourly and daily rollups are kept forever
+raw_retention_days: float = float(os.getenv("RAW_RETENTION_DAYS", "0"))
+retention_batch_size: int = 5000 # rows deleted per transaction
+vacuum_pages: int = 1000 # pages given back to the file system per transaction
+
+stage_seconds = metrics.Histogram("bot_stage_seconds", "Duration of the steps of the publish and rollup jobs.")
+command_seconds = metrics.Histogram("bot_command_seconds", "Time from the interaction to the end of a slash command.")
+command_errors = metrics.Counter("bot_command_errors_total", "Slash commands that raised an error.")
+overview_edits = metrics.Counter("bot_overview_edits_total", "Edits of the overview messages by result.")
+discord_rate_limits = metrics.Counter("bot_discord_rate_limits_total", "429 responses of the Discord api.")
+# discord.py retries most 429s on its own and only logs them
+logging.getLogger("discord.http").addHandler(metrics.RateLimitLogHandler(discord_rate_limits))
 
 # path to main.py
 # path_to_main = os.path.dirname(os.path.abspath(__file__))
@@ -40,43 +85,31 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 
 # Create and add the group to the tree immediately
 reminder_group = app_commands.Group(name="reminder", description="Commands to interact with reminders for players.")
+# only members that can manage the channels of a server see the overview commands
+overview_group = app_commands.Group(name="overview", description="Commands to manage the live games overview.",
+                                    guild_only=True, default_permissions=discord.Permissions(manage_channels=True))
+player_group = app_commands.Group(name="player", description="Commands to look up Combined Arms players.")
 
 def create_current_discord_timestamp(f: str):    # use current time zone
     now = datetime.datetime.now(datetime.timezone.utc)
     timestamp = int(now.timestamp())
     return f"<t:{timestamp}:{f}>"
 
-async def fetch_game_data():
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                print("Failed to fetch data from openra.net.")
-                return []
-            data = await resp.json()
-            return data
-
+def format_data_age(age: float) -> str:
+    seconds = int(age)
+    if seconds < 1:
+        return "just now"
+    return f"{seconds} second{'s' if seconds != 1 else ''} ago"
 
-def has_letters(s: str) -> bool:
-    return re.search('[a-zA-Z]', s) != None
-
-def create_games_overview_embed(games, timestamp_format="F", show_empty=False, show_outdated=False):
+def create_games_overview_embed(games, timestamp_format="F", show_empty=False, show_outdated=False, data_age=None):
     embed = discord.Embed(
         title="Combined Arms Games - " + create_current_discord_timestamp(timestamp_format),
         color=discord.Color.purple(),
         timestamp=datetime.datetime.now(datetime.timezone.utc)
     )
 
-    # Filter for Combined Arms games
-    ca_games = [game for game in games if game.get("mod", "").lower() == mode_name]
-
-    # Sort games by number of players (descending)
-    ca_games.sort(key=lambda x: x.get("players", 0), reverse=True)
-
-    # for really old version of CA, remove the initial 'v'
-    for game in ca_games:
-        if game.get("version", "0.0.0")[0] == 'v':
-            # trim the fist character
-            game.update({"version": game.get("version", "0.0.0")[1:]})
+    # Sort games by number of players (descending), the snapshot only contains Combined Arms games
+    ca_games = sorted(games, key=lambda x: x.get("players", 0), reverse=True)
 
     if not show_empty:
         relevant_games = [game for game in ca_games if game.get("players", 0) > 0]
@@ -86,28 +119,25 @@ def create_games_overview_embed(games, timestamp_format="F", show_empty=False, s
     if not relevant_games:
         embed.description = "No Combined Arms games found."
 
+    # the classification is cached per version string, the games are shared with other consumers
+    # of the snapshot and are not modified
+    classified_games = [(game, game_versions.classify_version(game.get("version", "0.0.0"))) for game in relevant_games]
+
     # devtest/prereleases
-    games_devtest = [game for game in relevant_games if ("dev" in game.get("version", "").lower())
-        or ("pre" in game.get("version", "").lower())]
+    games_devtest = [(game, info) for game, info in classified_games
+                     if info.tag in (game_versions.DEVTEST, game_versions.PRERELEASE)]
 
     # normal games, the version should not contain any letters
-    games_normal = [game for game in relevant_games if (game not in games_devtest and
-                    not has_letters(game.get("version", "")))]
+    games_normal = [(game, info) for game, info in classified_games if info.tag == game_versions.NORMAL]
 
-    newest_version = get_newest_version(games_normal)
     if not show_outdated:
-        games_normal = [game for game in games_normal if version.parse(game.get("version", "0.0.0")) >= newest_version]
-
-    relevant_games = games_normal + games_devtest
-
+        newest_version = max((info.parsed for _, info in games_normal), default=game_versions.parse_version("0.0.0"))
+        games_normal = [(game, info) for game, info in games_normal if info.parsed >= newest_version]
 
     # Group games by version
     version_groups = {}
-    for game in relevant_games:
-        version_str = game.get("version", "0.0.0")
-        if version_str not in version_groups:
-            version_groups[version_str] = []
-        version_groups[version_str].append(game)
+    for game, info in games_normal + games_devtest:
+        version_groups.setdefault(info.name, []).append(game)
 
     for version_str, grouped_games in sorted(version_groups.items(), reverse=True):
         lines = []
@@ -153,48 +183,58 @@ def create_games_overview_embed(games, timestamp_format="F", show_empty=False, s
         value = "\n".join(lines)
         embed.add_field(name=f"[{version_str}]", value=value, inline=False)
 
-    embed.set_footer(text="Data from openra.net/games", icon_url=icon_url)
+    footer_text = "Data from openra.net/games"
+    if data_age is not None:
+        footer_text += f" ({format_data_age(data_age)})"
+    embed.set_footer(text=footer_text, icon_url=icon_url)
     return embed
 
-def save_data_to_db(data):
+async def save_data_to_db(data, timestamp: int | None = None):
     # only save Combined Arms games with at least one player to reduce db size
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-
-    ca_games = [game for game in data if game.get("mod", "").lower() == mode_name and game.get("players", 0) > 0]
+    ca_games = [game for game in data if game.get("players", 0) > 0]
 
     # if there are no games, still save an entry with empty games list
     # to indicate that the bot was running at that time
 
-    # remove some keys to save data
-    for game in ca_games:
-        keys_to_remove = ["modwebsite", "modtitle", "modicon32"]
-        for key in keys_to_remove:
-            game.pop(key, None)
-
-        # remove all clients that are bots
-        clients = game.get("clients", [])
-        game["clients"] = [client for client in clients if not client.get("isbot", False)]
-
-    timestamp = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
-    games_json = json.dumps(ca_games)
+    # remove all clients that are bots to save data, unused keys are already dropped while parsing
+    # the games are shared with other consumers of the snapshot, so copy instead of updating them
+    ca_games = [{**game, "clients": [client for client in game.get("clients", []) if not client.get("isbot", False)]}
+                for game in ca_games]
+
+    if timestamp is None:
+        timestamp = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+
+    # written in batches by the snapshot buffer
+    await snapshot_buffer.add(timestamp, ca_games)
+
+async def send_reminder(discord_id: int, matched_names: list[str]) -> bool:
+    # returns True if the reminder was delivered and can be removed
+    async with reminder_semaphore:
+        for attempt in range(max_reminder_attempts):
+            try:
+                user = bot.get_user(discord_id)
+                if user is None:
+                    user = await bot.fetch_user(discord_id)
+                logger.info(f"Sending reminder to user {discord_id} for names: {matched_names}")
+                await user.send(f"The following players you are tracking are currently online: {', '.join(matched_names)}")
+                return True
+            except discord.RateLimited as e:
+                # discord.py gave up waiting on its own, try again once the bucket resets
+                retry_after = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    logging.error(f"Failed to send reminder to user {discord_id}: {e}")
+                    return False
+                retry_after = float(e.response.headers.get("Retry-After", 2 ** attempt))
+            discord_rate_limits.inc(scope="reminder")
+            logger.warning(f"Rate limited while sending reminder to user {discord_id}, retrying in {retry_after}s.")
+            await asyncio.sleep(retry_after)
 
-    cursor.execute('INSERT INTO games (timestamp, games_data) VALUES (?, ?)', (timestamp, games_json))
-    conn.commit()
-    conn.close()
+    logging.error(f"Failed to send reminder to user {discord_id}: still rate limited after {max_reminder_attempts} attempts.")
+    return False
 
 async def check_for_reminders(data):
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT id, discord_id, names FROM reminders')
-    all_reminders = cursor.fetchall()
-
-    if not all_reminders:
-        conn.close()
-        return  # No reminders set
-
-    ca_games = [game for game in data if game.get("mod", "").lower() == mode_name and game.get("players", 0) > 0]
+    ca_games = [game for game in data if game.get("players", 0) > 0]
     active_player_names = set()
     for game in ca_games:
         clients = game.get("clients", [])
@@ -202,38 +242,66 @@ async def check_for_reminders(data):
             if not client.get("isbot", False):
                 active_player_names.add(client.get("name", "").lower())
 
-    # do a query into the table where any of the names in the reminders is in the active_player_names
-    for reminder in all_reminders:
-        reminder_id = reminder[0]
-        discord_id = reminder[1]
-        names = json.loads(reminder[2])
-
-        matched_names = [name for name in names if name.lower() in active_player_names]
-        if matched_names:
-            user = bot.get_user(discord_id)
-            if user is None:
-                user = await bot.fetch_user(discord_id)
-            if user:
-                try:
-                    logger.info(f"Sending reminder to user {discord_id} for names: {matched_names}")
-                    await user.send(f"The following players you are tracking are currently online: {', '.join(matched_names)}")
-
-                    # remove the matched names from the reminder list
-                    remaining_names = [name for name in names if name.lower() not in active_player_names]
-                    if remaining_names:
-                        cursor.execute('UPDATE reminders SET names = ? WHERE discord_id = ?',
-                                     (json.dumps(remaining_names), discord_id))
-                    else:
-                        cursor.execute('DELETE FROM reminders WHERE discord_id = ?', (discord_id,))
-                    conn.commit()
-                except Exception as e:
-                    logging.error(f"Failed to send reminder to user {discord_id}: {e}")
+    # look up the online players in the reminder index instead of going over every reminder
+    matches = reminders.match_reminders(active_player_names)
+    if not matches:
+        return
 
-    conn.close()
+    # send all DMs concurrently, bounded by reminder_semaphore
+    results = await asyncio.gather(*[send_reminder(discord_id, names) for discord_id, names in matches.items()])
+
+    # remove the matched names of all delivered reminders in a single transaction
+    sent = {discord_id: names for (discord_id, names), delivered in zip(matches.items(), results) if delivered}
+    if sent:
+        await db.write(reminders.remove_matched_reminders, sent)
+        for discord_id, names in sent.items():
+            reminders.unindex_reminder_names(discord_id, names)
+
+def get_fetch_interval() -> float:
+    # poll faster while players are online and slower while nobody plays
+    snapshot = master_server.latest_snapshot()
+    if snapshot is None:
+        return fetch_interval
+    if any(game.get("players", 0) > 0 for game in snapshot.games):
+        return active_fetch_interval
+    return idle_fetch_interval
+
+async def get_current_snapshot() -> master_server.Snapshot | None:
+    # the snapshot of the fetch job, only fetched again if that job is behind
+    # None if the master server is unreachable, the jobs skip the tick instead of publishing an empty list
+    try:
+        return await master_server.get_snapshot(max_age=get_fetch_interval() + stage_offset)
+    except master_server.MasterServerError:
+        # the fetch job already logged and counted the failure
+        return None
+
+async def fetch_job():
+    snapshot = await master_server.get_snapshot(max_age=0)
+    player_names.update_name_index(snapshot.games, int(time.time()))
+
+async def persist_job(now: float | None = None):
+    snapshot = await get_current_snapshot()
+    if snapshot is None:
+        return
+    if now is None:
+        now = time.time()
+    # stored with the time of the slot, so late runs do not shift the sampling grid
+    await save_data_to_db(snapshot.games, timestamp=int(now // persist_interval * persist_interval))
+
+async def reminder_job():
+    snapshot = await get_current_snapshot()
+    if snapshot is None:
+        return
+    await check_for_reminders(snapshot.games)
+
+async def reminder_task():
+    # runs on its own, so slow DMs never stretch the overview update cycle
+    await bot.wait_until_ready()
+    await scheduler.run_periodic("reminders", reminder_job, reminder_interval, offset=stage_offset, max_backoff=max_job_backoff)
 
 async def update_presence(data):
     # update the bot's presence
-    ca_games = [game for game in data if game.get("mod", "").lower() == mode_name]
+    ca_games = data
 
     total_players = sum(game.get("players", 0) for game in ca_games)
     active_games = [game for game in ca_games if game.get("players", 0) > 0]
@@ -241,52 +309,157 @@ async def update_presence(data):
     player_description = "players" if total_players != 1 else "player"
     games_description = "games" if len(active_games) != 1 else "game"
 
+    presence_name = f"{total_players} {player_description} in {len(active_games)} CA {games_description}"
+
+    # only send a presence update if the text changed or it is due for a refresh
+    global last_presence_name, last_presence_update, presence_updates_skipped
+    if presence_name == last_presence_name and time.monotonic() - last_presence_update < overview_max_age:
+        presence_updates_skipped += 1
+        return
+
     activity = discord.Activity(
         type=discord.ActivityType.watching,
-        name=f"{total_players} {player_description} in {len(active_games)} CA {games_description}"
+        name=presence_name
     )
     await bot.change_presence(activity=activity)
+    last_presence_name = presence_name
+    last_presence_update = time.monotonic()
     return
 
-async def update_bot_task():
-    import traceback
-    await bot.wait_until_ready()
-    channel = bot.get_channel(int(os.getenv("GAMES_CHANNEL_ID")))
-
-    if not channel:
-        print(f"Channel with ID {os.getenv('GAMES_CHANNEL_ID')} not found.")
+def get_overview_digest(embed: discord.Embed) -> str:
+    # hash of everything the overview shows except the title/timestamp, which change on every render
+    content = embed.to_dict()
+    content.pop("title", None)
+    content.pop("timestamp", None)
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+async def edit_overview(channel_id: int, message_id: int, embed: discord.Embed, digest: str) -> bool:
+    # returns False if the channel or message is gone for good and the subscription can be removed
+    async with overview_semaphore:
+        message = bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+        try:
+            await message.edit(content=None, embed=embed)
+        except discord.RateLimited:
+            # discord.py gave up waiting on this channel's bucket, the edit is retried next tick
+            discord_rate_limits.inc(scope="overview")
+            overview_edits.inc(result="rate_limited")
+            return True
+        except discord.NotFound:
+            overview_edits.inc(result="not_found")
+            return False
+        except discord.Forbidden:
+            # permissions may come back, only give up after a few ticks
+            overview_edits.inc(result="forbidden")
+            overview_failures[channel_id] = overview_failures.get(channel_id, 0) + 1
+            return overview_failures[channel_id] < max_overview_failures
+        except discord.HTTPException as e:
+            if e.status == 429:
+                discord_rate_limits.inc(scope="overview")
+            overview_edits.inc(result="error")
+            logger.warning(f"Failed to edit the overview in channel {channel_id}: {e}")
+            return True
+
+    overview_edits.inc(result="ok")
+    overview_failures.pop(channel_id, None)
+    overview_digests[channel_id] = digest
+    overview_edit_times[channel_id] = time.monotonic()
+    return True
+
+async def publish_overview(data):
+    # renders the embed once and edits every subscribed overview message that is out of date
+    global overview_edits_skipped
+    subscriptions = await db.read(overviews.get_subscriptions)
+    if not subscriptions:
         return
-    try:
-        message = await channel.fetch_message(int(os.getenv("GAMES_MESSAGE_ID")))
-    except Exception as e:
-        print(f"Could not fetch message: {e}")
+
+    embed = create_games_overview_embed(data, timestamp_format="R")
+    digest = get_overview_digest(embed)
+
+    # skip the edit if nothing changed, but refresh the message once it is overview_max_age old
+    now = time.monotonic()
+    outdated = [(channel_id, message_id) for channel_id, message_id in subscriptions
+                if overview_digests.get(channel_id) != digest or now - overview_edit_times.get(channel_id, 0) >= overview_max_age]
+    overview_edits_skipped += len(subscriptions) - len(outdated)
+    if not outdated:
         return
-    while not bot.is_closed():
-        try:
-            # fetch game data
-            data = await fetch_game_data()
 
-            # save data to sqlite, key should be the timestamp
-            global task_iteration
-            if task_iteration % 2 == 0: # Save to DB every 2nd iteration (every minute)
-                save_data_to_db(data)
+    results = await asyncio.gather(*[edit_overview(channel_id, message_id, embed, digest) for channel_id, message_id in outdated])
 
-            # check for reminders and send them
-            await check_for_reminders(data)
+    dead_channels = [channel_id for (channel_id, _), alive in zip(outdated, results) if not alive]
+    if dead_channels:
+        logger.info(f"Removing the overview subscriptions of the deleted or inaccessible channels {dead_channels}.")
+        await db.write(overviews.remove_subscriptions, dead_channels)
+        forget_overview(dead_channels)
 
-            # update the embed
-            embed = create_games_overview_embed(data, timestamp_format="R")
-            await message.edit(content=None, embed=embed)
+def forget_overview(channel_ids: list[int]):
+    for channel_id in channel_ids:
+        overview_digests.pop(channel_id, None)
+        overview_edit_times.pop(channel_id, None)
+        overview_failures.pop(channel_id, None)
 
-            await update_presence(data)
+async def publish_job():
+    snapshot = await get_current_snapshot()
+    if snapshot is None:
+        return
 
-            task_iteration += 1
+    # update the embeds and the presence, both are skipped if nothing changed
+    with stage_seconds.time(stage="publish"):
+        await publish_overview(snapshot.games)
+    with stage_seconds.time(stage="presence"):
+        await update_presence(snapshot.games)
+
+    global task_iteration
+    task_iteration += 1
+    if task_iteration % publish_report_interval == 0:
+        logger.info(f"Skipped {overview_edits_skipped} overview edits and {presence_updates_skipped} presence updates without changes so far.")
+
+async def import_env_overview():
+    # the overview configured through GAMES_CHANNEL_ID/GAMES_MESSAGE_ID becomes a regular subscription
+    channel_id = int(os.getenv("GAMES_CHANNEL_ID") or 0)
+    if not channel_id or await db.read(overviews.get_subscription, channel_id) is not None:
+        return
 
-            await asyncio.sleep(30)
-        except Exception as e:
-            print(f"[GamesMessageTask] Unhandled error: {e}")
-            traceback.print_exc()
-            await asyncio.sleep(60)
+    message_id = int(os.getenv("GAMES_MESSAGE_ID") or 0)
+    channel = bot.get_channel(channel_id)
+    if message_id == 0:
+        if not channel:
+            print(f"Channel with ID {channel_id} not found.")
+            return
+        # message does not exist, create it
+        message_id = (await channel.send("Games overview...")).id
+    guild_id = channel.guild.id if channel is not None and getattr(channel, "guild", None) else None
+    await db.write(overviews.add_subscription, channel_id, guild_id, message_id)
+    logger.info(f"Added the overview message {message_id} in channel {channel_id} from the environment.")
+
+async def update_bot_task():
+    await bot.wait_until_ready()
+    try:
+        await import_env_overview()
+    except Exception as e:
+        print(f"Could not set up the overview from GAMES_CHANNEL_ID/GAMES_MESSAGE_ID: {e}")
+
+    # separate cadences, a slow Discord edit never delays the fetches or the database samples
+    await asyncio.gather(
+        scheduler.run_periodic("fetch", fetch_job, get_fetch_interval, max_backoff=max_job_backoff, run_at_start=True),
+        scheduler.run_periodic("persist", persist_job, persist_interval, offset=stage_offset, max_backoff=max_job_backoff),
+        scheduler.run_periodic("publish", publish_job, publish_interval, offset=stage_offset, max_backoff=max_job_backoff),
+    )
+
+@bot.event
+async def setup_hook():
+    # one pooled http session for all requests to the master server
+    await master_server.open_session()
+    await metrics.start_server()
+    rendering.start()
+    # snapshots buffered when the bot stopped unexpectedly
+    await snapshot_buffer.recover()
+    # in-memory name -> subscribers index used to match reminders every tick
+    reminders.build_index(await db.read(reminders.get_all_reminder_names))
+    # in-memory index of the recent player names for the autocomplete of /reminder add
+    player_names.build_name_index(await db.read(player_names.get_recent_names, int(time.time()) - player_names.recent_days * history.DAY))
+    bot.loop.create_task(reminder_task())
+    bot.loop.create_task(rollup_task())
+    bot.loop.create_task(update_bot_task())
 
 @bot.event
 async def on_ready():
@@ -322,30 +495,6 @@ async def on_ready():
     except Exception as e:
         print(f"Error syncing commands: {e}")
 
-
-    global channel_id
-    global message_id
-
-    channel_id = int(os.getenv("GAMES_CHANNEL_ID"))
-    message_id = int(os.getenv("GAMES_MESSAGE_ID"))
-
-    if os.getenv("GAMES_CHANNEL_ID"):
-        channel = bot.get_channel(int(os.getenv("GAMES_CHANNEL_ID")))
-        if not channel:
-            print(f"Channel with ID {os.getenv('GAMES_CHANNEL_ID')} not found.")
-            return
-
-        if message_id == 0:
-            # message does not exist, create it
-            message = await channel.send("Games overview...")
-            print(f"Message ID (save this inside the .env): {message.id}")
-        else:
-            # message exists, fetch it
-            message = await channel.fetch_message(message_id)
-
-
-        bot.loop.create_task(update_bot_task())  # Start the message update loop
-
 @bot.tree.command(name="players", description="Lists players in active Combined Arms games.")
 async def players(interaction: discord.Interaction):
     # show all players in games
@@ -353,14 +502,14 @@ async def players(interaction: discord.Interaction):
     logging.info(f"Players command invoked by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
 
     try:
-        data = await fetch_game_data()
+        snapshot = await master_server.get_snapshot()
     except Exception as e:
         await interaction.followup.send(f"Error fetching data: {e}")
         return
+    data = snapshot.games
 
-    # filter for Combined Arms games
-    ca_games = [game for game in data if game.get("mod", "").lower()
-                == mode_name]
+    # the snapshot only contains Combined Arms games
+    ca_games = data
 
     # count players
     total_players = sum(game.get("players", 0) for game in ca_games)
@@ -387,17 +536,13 @@ async def players(interaction: discord.Interaction):
             players_string += ", ".join(player_names) + ", "
 
     if total_players == 0:
-        await interaction.followup.send("No players found.")
+        await interaction.followup.send(f"No players found.\n-# Data from {format_data_age(snapshot.age)}")
         return
 
     # remove last comma and space
     players_string = players_string[:-2]
 
-    await interaction.followup.send(f"Current players: **{total_players}**\n{players_string}")
-
-def get_newest_version(games):
-    versions = [version.parse(game.get("version", "0.0.0")) for game in games if "version" in game]
-    return max(versions) if versions else version.parse("0.0.0")
+    await interaction.followup.send(f"Current players: **{total_players}**\n{players_string}\n-# Data from {format_data_age(snapshot.age)}")
 
 @bot.tree.command(name="games", description="Lists Combined Arms games.")
 @app_commands.describe(outdated="Show games with outdated versions", empty="Show games with zero players")
@@ -406,142 +551,82 @@ async def games(interaction: discord.Interaction, outdated: bool = False, empty:
     logging.info(f"Games command invoked with outdated: {outdated}, empty: {empty} by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
 
     try:
-        data = await fetch_game_data()
+        snapshot = await master_server.get_snapshot()
     except Exception as e:
         await interaction.followup.send(f"Error fetching data: {e}")
         return
+    data = snapshot.games
 
-    embed = create_games_overview_embed(data, timestamp_format="F", show_empty=empty, show_outdated=outdated)
+    embed = create_games_overview_embed(data, timestamp_format="F", show_empty=empty, show_outdated=outdated,
+                                        data_age=snapshot.age)
 
     await interaction.followup.send(embed=embed)
 
-def aggregate_average_hourly_player_counts():
-    # goes over the dataset stored in the default table and calculates the average player count for every hour
-
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT timestamp FROM avg_hourly_player_count ORDER BY timestamp DESC LIMIT 1')
-    result = cursor.fetchone()
-
-    biggest_timestamp = None
-    if result is None:
-        logging.info("No entries in avg_hourly_player_count table yet.")
-        # set start of 2025 as we dont have earlier data
-        biggest_timestamp = int(datetime.datetime(2025, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc).timestamp())
-    else:
-        biggest_timestamp = result[0]
-
-    biggest_datetime = datetime.datetime.fromtimestamp(biggest_timestamp, tz=datetime.timezone.utc)
-
-    # start from the hour after the biggest timestamp
-    start_hour = (biggest_datetime + datetime.timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
-
-    now = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=1)
-    current_hour = start_hour
-
-    inserted_entries = 0
-    while current_hour <= now:
-        avg_count = get_average_player_count_on_hour(current_hour)
-        if avg_count < 0:
-            logging.info(f"No data for hour starting at {current_hour}, skipping.")
-            current_hour += datetime.timedelta(hours=1)
-            continue
-
-        cursor.execute('INSERT INTO avg_hourly_player_count (timestamp, average_players) VALUES (?, ?)',
-                      (int(current_hour.timestamp()), avg_count))
-        current_hour += datetime.timedelta(hours=1)
-        inserted_entries += 1
-
-    conn.commit()
-    conn.close()
-    logging.info(f"Inserted {inserted_entries} new average hourly player count entries for {start_hour} to {now}.")
-
-def get_average_player_count_on_day(day: datetime.date) -> float:
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-
-    start_timestamp = int(datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc).timestamp())
-    end_timestamp = int(datetime.datetime.combine(day, datetime.time.max, tzinfo=datetime.timezone.utc).timestamp())
-
-    cursor.execute('SELECT games_data FROM games WHERE timestamp >= ? AND timestamp <= ?',
-                  (start_timestamp, end_timestamp))
-    entries = cursor.fetchall()
-    conn.close()
-
-    # structure of an entry is {"timestamp": 1234567890, "games": [...]}
-    # data is already filtered
-    total_player_counts = []
-    for entry in entries:
-        games = json.loads(entry[0])
-        total_players = sum(game.get("players", 0) for game in games)
-        total_player_counts.append(total_players)
-
-    if not total_player_counts:
-        return 0
-
-    return sum(total_player_counts) / len(total_player_counts)
-
-def get_average_player_count_on_hour(hour: datetime.datetime) -> float:
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-
-    start_timestamp = int(hour.replace(minute=0, second=0, microsecond=0, tzinfo=datetime.timezone.utc).timestamp())
-    end_timestamp = int(hour.replace(minute=59, second=59, microsecond=999999, tzinfo=datetime.timezone.utc).timestamp())
-
-    cursor.execute('SELECT games_data FROM games WHERE timestamp >= ? AND timestamp <= ?',
-                  (start_timestamp, end_timestamp))
-    entries = cursor.fetchall()
-    conn.close()
-
-    # if there are no entries, return an error value
-    if not entries:
-        return -1
-
-    # structure of an entry is {"timestamp": 1234567890, "games": [...]}
-    # data is already filtered
-    total_player_counts = []
-    for entry in entries:
-        games = json.loads(entry[0])
-        total_players = sum(game.get("players", 0) for game in games)
-        total_player_counts.append(total_players)
-
-    if not total_player_counts:
-        return 0
-    return sum(total_player_counts) / len(total_player_counts)
+async def aggregate_average_hourly_player_counts():
+    # rolls up every closed hour and day since the last run into avg_hourly_player_count/avg_daily_player_count
+    # runs on the database writer thread so the rollup query does not block the event loop
+    inserted_entries = await db.write(history.update_rollups)
+
+    for table, count in inserted_entries.items():
+        logging.info(f"Inserted {count} new entries into {table}.")
+
+async def prune_history():
+    # deletes raw snapshots older than raw_retention_days that are covered by the rollups, the rollups are kept forever
+    cutoff = await db.read(history.get_retention_cutoff, raw_retention_days)
+    deleted_total = 0
+    while True:
+        # one small transaction per batch, so snapshot inserts are never blocked for long
+        deleted = await db.write(history.prune_raw_snapshots, cutoff, retention_batch_size)
+        deleted_total += deleted
+        if deleted < retention_batch_size:
+            break
+
+    # stops once nothing is freed anymore, e.g. if the database is not in auto_vacuum=INCREMENTAL mode
+    previous_free_pages = None
+    free_pages = await db.write(db.incremental_vacuum, vacuum_pages)
+    while 0 < free_pages and (previous_free_pages is None or free_pages < previous_free_pages):
+        previous_free_pages = free_pages
+        free_pages = await db.write(db.incremental_vacuum, vacuum_pages)
+
+    if deleted_total:
+        logging.info(f"Deleted {deleted_total} raw snapshots and unused game records before {cutoff}.")
+
+async def rollup_job():
+    # an hour can only be rolled up once all of its snapshots are in the database
+    await snapshot_buffer.flush()
+    with stage_seconds.time(stage="rollup"):
+        await aggregate_average_hourly_player_counts()
+    player_names.prune_name_index(int(time.time()) - player_names.recent_days * history.DAY)
+    # only prune after the rollups are up to date, the cutoff never passes their watermarks
+    if raw_retention_days > 0:
+        with stage_seconds.time(stage="prune"):
+            await prune_history()
+
+async def rollup_task():
+    # runs once at startup and then shortly after every hour has closed
+    await scheduler.run_periodic("rollup", rollup_job, history.HOUR, offset=rollup_delay, max_backoff=max_job_backoff,
+                                 run_at_start=True)
+
+async def playername_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    # answered from memory, every keystroke triggers a request
+    return [
+        app_commands.Choice(name=name[:100], value=name[:100])
+        for name in player_names.complete_name(current)
+    ]
 
 # sets a reminder for a nickname add command
 @reminder_group.command(name="add", description="Set a reminder for when a player is in a game.")
+@app_commands.autocomplete(playername=playername_autocomplete)
 async def reminder_add(interaction: discord.Interaction, playername: str):
     await interaction.response.defer(ephemeral=True)
     logging.info(f"Reminder add command invoked with name: {playername} by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
 
     playername = playername.lower().strip()
 
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT names FROM reminders WHERE discord_id = ?', (interaction.user.id,))
-    result = cursor.fetchone()
-
-    if result:
-        names = json.loads(result[0])
-        if playername not in names:
-            names.append(playername)
-        else:
-            conn.close()
-            await interaction.followup.send(f"Reminder for {playername} already set!")
-            return
-        # Update the document
-        cursor.execute('UPDATE reminders SET names = ? WHERE discord_id = ?',
-                      (json.dumps(names), interaction.user.id))
-    else:
-        # Insert new document if not found
-        cursor.execute('INSERT INTO reminders (discord_id, names) VALUES (?, ?)',
-                      (interaction.user.id, json.dumps([playername])))
-
-    conn.commit()
-    conn.close()
+    if not await db.write(reminders.add_reminder_name, interaction.user.id, playername):
+        await interaction.followup.send(f"Reminder for {playername} already set!")
+        return
+    reminders.index_reminder_name(interaction.user.id, playername)
 
     # the value should be a python list
     await interaction.followup.send(f"I'll remind you when {playername} is in a game.")
@@ -551,72 +636,111 @@ async def reminder_clear(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     logging.info(f"Reminder clear command invoked by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
 
-    conn = sqlite3.connect('games_db.sqlite')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM reminders WHERE discord_id = ?', (interaction.user.id,))
-    conn.commit()
-    conn.close()
+    await db.write(reminders.remove_reminder_names, interaction.user.id)
+    reminders.unindex_reminder_names(interaction.user.id)
 
     await interaction.followup.send(f"All reminders cleared.")
 
-def create_stats_embed(filename: str, image_path: str, title: str):
+@overview_group.command(name="subscribe", description="Post a live overview of the Combined Arms games in this channel.")
+async def overview_subscribe(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    logging.info(f"Overview subscribe command invoked by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
+
+    try:
+        snapshot = await master_server.get_snapshot()
+    except master_server.MasterServerError as e:
+        await interaction.followup.send(f"Error fetching data: {e}")
+        return
+    embed = create_games_overview_embed(snapshot.games, timestamp_format="R")
+    try:
+        message = await interaction.channel.send(embed=embed)
+    except discord.Forbidden:
+        await interaction.followup.send("I am not allowed to send messages in this channel.")
+        return
+
+    old_message_id = await db.read(overviews.get_subscription, interaction.channel_id)
+    await db.write(overviews.add_subscription, interaction.channel_id, interaction.guild_id, message.id, interaction.user.id)
+    forget_overview([interaction.channel_id])
+    overview_digests[interaction.channel_id] = get_overview_digest(embed)
+    overview_edit_times[interaction.channel_id] = time.monotonic()
+
+    if old_message_id is not None:
+        # only one overview per channel, the old message would never be updated again
+        try:
+            await interaction.channel.get_partial_message(old_message_id).delete()
+        except discord.HTTPException:
+            pass
+    await interaction.followup.send("The overview in this channel is now updated live.")
+
+@overview_group.command(name="unsubscribe", description="Stop updating the live overview in this channel.")
+async def overview_unsubscribe(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    logging.info(f"Overview unsubscribe command invoked by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
+
+    message_id = await db.read(overviews.get_subscription, interaction.channel_id)
+    if message_id is None:
+        await interaction.followup.send("There is no live overview in this channel.")
+        return
+
+    await db.write(overviews.remove_subscriptions, [interaction.channel_id])
+    forget_overview([interaction.channel_id])
+    try:
+        await interaction.channel.get_partial_message(message_id).delete()
+    except discord.HTTPException:
+        pass
+    await interaction.followup.send("The live overview in this channel was removed.")
+
+def format_duration(seconds: int) -> str:
+    hours, minutes = divmod(seconds // 60, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+@player_group.command(name="seen", description="Shows when a player was last in a game and their play time.")
+async def player_seen(interaction: discord.Interaction, playername: str):
+    await interaction.response.defer()
+    logging.info(f"Player seen command invoked with name: {playername} by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
+
+    playername = playername.strip()
+    session = await db.read(player_sessions.get_last_session, playername)
+    if session is None:
+        await interaction.followup.send(f"{playername} was never seen in a game.")
+        return
+
+    game_name, version, start_ts, end_ts = session
+    now = int(time.time())
+    week_play_time = await db.read(player_sessions.get_play_time, playername, now - 7 * history.DAY, now)
+    if end_ts == await db.read(player_sessions.get_watermark):
+        # the session is still open
+        text = f"{playername} is in **{game_name}** ({version}) since <t:{start_ts}:R>."
+    else:
+        text = f"{playername} was last seen <t:{end_ts}:R> in **{game_name}** ({version})."
+    await interaction.followup.send(f"{text}\nPlay time in the last week: {format_duration(week_play_time)}.")
+
+@player_group.command(name="search", description="Searches the names of all players that were ever in a game.")
+async def player_search(interaction: discord.Interaction, query: app_commands.Range[str, 1, 64]):
+    await interaction.response.defer()
+    logging.info(f"Player search command invoked with query: {query} by user {interaction.user} ({interaction.user.id}) and interaction id {interaction.id} in {interaction.guild}.")
+
+    matches = await db.read(player_names.search_names, query, 15)
+    if not matches:
+        await interaction.followup.send(f"No player names match `{query}`.")
+        return
+
+    lines = [f"**{discord.utils.escape_markdown(name)}**, last seen <t:{last_seen}:R>" for name, last_seen in matches]
+    embed = discord.Embed(title=f"Players matching \"{query}\"", description="\n".join(lines), color=discord.Color.blue())
+    await interaction.followup.send(embed=embed)
+
+def create_stats_embed(filename: str, title: str):
     embed = discord.Embed(
         title=title,
         color=discord.Color.blue(),
         timestamp=datetime.datetime.now(datetime.timezone.utc)
     )
-    file = discord.File(image_path, filename=filename)
     embed.set_image(url=f"attachment://{filename}")
     embed.set_footer(text="Data from openra.net/games", icon_url=icon_url)
     return embed
 
-def create_plot(x_times, y_values, title, x_label, y_label, output_path, period="day", timezone="UTC"):
-    # Convert x_times to the specified timezone
-    tz = pytz.timezone(timezone)
-    if x_times and isinstance(x_times[0], datetime.datetime):
-        x_times = [dt.astimezone(tz) for dt in x_times]
-
-    plt.style.use('seaborn-v0_8')
-    plt.figure(figsize=(12, 6), facecolor='white')
-    ax = plt.gca()
-
-    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-
-    if y_values:  # Ensure y_values is not empty
-        ax.set_ylim(bottom=0, top=max(y_values) * 1.1)  # Start at 0, extend 10% above max for padding
-
-    if x_times:  # Ensure x_times is not empty
-        ax.set_xlim(left=min(x_times), right=max(x_times))
-
-    if period == "day":
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M", tz=pytz.timezone(timezone)))
-        ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
-    elif period == "week":
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d %H:%M", tz=pytz.timezone(timezone)))
-        # only show midnight and noon
-        ax.xaxis.set_major_locator(mdates.HourLocator(byhour=[0, 12], interval=1))
-    elif period == "month":
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d", tz=pytz.timezone(timezone)))
-        ax.xaxis.set_major_locator(mdates.DayLocator(interval=2))
-    elif period == "year":
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m", tz=pytz.timezone(timezone)))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
-
-    plt.plot(x_times, y_values, color='#1f77b4', linewidth=2.5)
-    plt.title(f"{title}", fontsize=16, fontweight='bold', pad=15, color='#333333')  # Add timezone to title
-    plt.xlabel(f"{x_label} ({timezone})", fontsize=12, fontweight='medium', color='#333333')
-    plt.ylabel(y_label, fontsize=12, fontweight='medium', color='#333333')
-    plt.xticks(rotation=45, ha='right', fontsize=10, color='#333333')
-    plt.yticks(fontsize=10, color='#333333')
-    plt.grid(True, which='both', linestyle='--', linewidth=0.7, alpha=0.7, color='#cccccc')
-    ax.set_facecolor('#f5f5f5')
-    for spine in ax.spines.values():
-        spine.set_edgecolor('#cccccc')
-        spine.set_linewidth(1)
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close()
-
 async def period_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
     periods = ["day", "week", "month", "year"]
     return [
@@ -636,6 +760,13 @@ async def timezone_autocomplete(interaction: discord.Interaction, current: str)
         if current.lower() in tz.lower()
     ][:25]
 
+stats_titles = {
+    "day": "Average Player Count in the Last 24 Hours",
+    "week": "Average Player Count in the Last Week",
+    "month": "Average Player Count in the Last Month",
+    "year": "Average Player Count in the Last Year",
+}
+
 @bot.tree.command(name="stats", description="Shows online player statistics for Combined Arms.")
 @app_commands.describe(
     period="Time period for stats: day, week, month, year. Default: day",
@@ -659,57 +790,83 @@ async def stats(interaction: discord.Interaction, period: str = "day", timezone:
         )
         return
 
-    # get data for the last 24 hours
-    match period:
-        case "day":
-            now = datetime.datetime.now(datetime.timezone.utc)
-            last_24_hours = [(now - datetime.timedelta(hours=i)).replace(minute=0, second=0, microsecond=0) for i in range(24)]
-            last_24_hours.reverse()  # so that the oldest hour is first
-            # convert to timezone
-            player_counts = [get_average_player_count_on_hour(hour) for hour in last_24_hours]
-
-            # create a plot with matplotlib
-            create_plot(last_24_hours, player_counts, "Average Player Count in the Last 24 Hours", f"Time", "Average Player Count",
-                        "last_day.png", period="day", timezone=timezone)
-        case "week":
-            now = datetime.datetime.now(datetime.timezone.utc)
-            # split up week into hours
-            last_168_hours = [(now - datetime.timedelta(hours=i)).replace(minute=0, second=0, microsecond=0) for i in range(168)]
-            last_168_hours.reverse()  # so that the oldest hour is first
-            player_counts = [get_average_player_count_on_hour(hour) for hour in last_168_hours]
-
-            # create a plot with matplotlib
-            create_plot(last_168_hours, player_counts, "Average Player Count in the Last Week", f"Time", "Average Player Count",
-                        "last_week.png", period="week", timezone=timezone)
-        case "month":
-            now = datetime.datetime.now(datetime.timezone.utc)
-            last_30_days = [(now - datetime.timedelta(days=i)).date() for i in range(30)]
-            last_30_days.reverse()  # so that the oldest day is first
-            player_counts = [get_average_player_count_on_day(day) for day in last_30_days]
-
-            # create a plot with matplotlib
-            create_plot(last_30_days, player_counts, "Average Player Count in the Last Month", f"Time", "Average Player Count",
-                        "last_month.png", period="month", timezone=timezone)
-        case "year":
-            # do this for every day
-            now = datetime.datetime.now(datetime.timezone.utc)
-            last_365_days = [(now - datetime.timedelta(days=i)).date() for i in range(365)]
-            last_365_days.reverse()  # so that the oldest day is first
-            player_counts = [get_average_player_count_on_day(day) for day in last_365_days]
-
-            # create a plot with matplotlib
-            create_plot(last_365_days, player_counts, "Average Player Count in the Last Year", f"Time", "Average Player Count",
-                        "last_year.png", period="year", timezone=timezone)
-        case _:
-            await interaction.followup.send("Invalid period. Available: day, week, month, year.")
+    if period not in history.STATS_PERIODS:
+        await interaction.followup.send("Invalid period. Available: day, week, month, year.")
+        return
+
+    # the key changes when a rollup ran or a new hour/day bucket started, so old charts are never served after that
+    cache_key = (period, timezone, *await db.read(history.get_series_watermark, period))
+    image = rendering.get_cached_chart(cache_key)
+
+    if image is None:
+        # one query returns every hourly/daily bucket of the period, missing buckets are None
+        bucket_times, player_counts = await db.read(history.get_average_player_count_series, period)
+
+        # create a plot with matplotlib in the rendering worker pool
+        try:
+            image = await rendering.render_plot(bucket_times, player_counts, stats_titles[period], f"Time", "Average Player Count",
+                                                period=period, timezone=timezone)
+        except rendering.RenderQueueFullError:
+            await interaction.followup.send("Too many charts are being rendered right now, please try again in a moment.")
             return
+        rendering.cache_chart(cache_key, image)
 
-    embed = create_stats_embed(f"last_{period}.png", f"last_{period}.png", f"Combined Arms Player Statistics - Last {period.capitalize()}")
-    await interaction.followup.send(embed=embed, file=discord.File(f"last_{period}.png"))
+    filename = f"last_{period}.png"
+    embed = create_stats_embed(filename, f"Combined Arms Player Statistics - Last {period.capitalize()}")
+    await interaction.followup.send(embed=embed, file=discord.File(image, filename=filename))
 
     # embed = create_stats_embed("stats.png", "last_24_hours.png", f"Combined Arms Player Statistics - Last {period.capitalize()}")
     # await interaction.followup.send(embed=embed, file=discord.File("last_24_hours.png"))
 
+@bot.tree.command(name="metrics", description="Shows latency and error metrics of the bot.")
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def show_metrics(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    text = "\n".join(metrics.summary()) or "No metrics recorded yet."
+    # messages are limited to 2000 characters
+    if len(text) > 1900:
+        text = text[:1900] + "\n..."
+    await interaction.followup.send(f"```\n{text}\n```", ephemeral=True)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    # measured from the creation of the interaction, so the time until the bot received it is included
+    elapsed = (datetime.datetime.now(datetime.timezone.utc) - interaction.created_at).total_seconds()
+    command_seconds.observe(elapsed, command=command.qualified_name)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    command_name = interaction.command.qualified_name if interaction.command else "unknown"
+    command_errors.inc(command=command_name)
+    if isinstance(error, app_commands.CheckFailure):
+        if not interaction.response.is_done():
+            await interaction.response.send_message("You are not allowed to use this command.", ephemeral=True)
+        return
+    logger.error(f"Error in command {command_name}", exc_info=error)
+
+async def run_bot():
+    try:
+        async with bot:
+            await bot.start(os.getenv("DISCORD_BOT_TOKEN"))
+    finally:
+        try:
+            await snapshot_buffer.flush()
+        except Exception as e:
+            print(f"Could not write the buffered snapshots, they are written on the next start: {e}")
+        await master_server.close_session()
+        await metrics.stop_server()
+
 if __name__ == "__main__":
+    # migrates the schema and backfills derived columns before the bot connects
+    db.init(use_incremental_vacuum=raw_retention_days > 0)
     bot.tree.add_command(reminder_group)
-    bot.run(os.getenv("DISCORD_BOT_TOKEN"))
+    bot.tree.add_command(overview_group)
+    bot.tree.add_command(player_group)
+    try:
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rendering.shutdown()
+        db.close()
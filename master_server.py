@@ -0,0 +1,270 @@
+import asyncio
+import codecs
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+import aiohttp
+import metrics
+
+logger = logging.getLogger(__name__)
+
+url = "https://master.openra.net/games?protocol=2&type=json"
+mod_name = "ca"
+# games of other mods are dropped while parsing
+mod_names: set[str] = {mod_name}
+# keys of a game entry nobody uses, dropped while parsing
+unused_keys = ("modwebsite", "modtitle", "modicon32")
+
+connect_timeout: float = 5
+read_timeout: float = 15
+max_retries: int = 3
+retry_base_delay: float = 1  # seconds, doubled on every retry
+
+# snapshots younger than this are served from the cache instead of asking the master server again
+max_snapshot_age: float = float(os.getenv("SNAPSHOT_MAX_AGE", "30"))
+
+# one pooled session for the lifetime of the bot, opened in setup_hook
+_session: aiohttp.ClientSession | None = None
+
+# validators and payload of the last successful response, used for conditional requests
+_etag: str | None = None
+_last_modified: str | None = None
+_last_digest: bytes | None = None
+_last_data: list = []
+
+payload_bytes = metrics.Histogram("bot_master_server_payload_bytes", "Size of the game list bodies of the master server.",
+                                  buckets=metrics.SIZE_BUCKETS)
+fetches = metrics.Counter("bot_master_server_fetches_total", "Requests to the master server by result.")
+
+
+class MasterServerError(Exception):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    # games of the configured mods, shared by every consumer and not to be mutated
+    games: list[dict]
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+# latest snapshot and the request refreshing it, if one is running
+_snapshot: Snapshot | None = None
+_snapshot_task: asyncio.Task | None = None
+# time of the last failed refresh, None once a refresh succeeded again
+_last_failure: float | None = None
+
+
+async def open_session():
+    global _session
+    connector = aiohttp.TCPConnector(limit=10, keepalive_timeout=120, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=connect_timeout + read_timeout, connect=connect_timeout,
+                                    sock_read=read_timeout)
+    _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+# skips everything up to the next brace outside of a json string, stops early at a string that is not
+# complete yet, so the python loop only runs once per brace and not once per token
+_brace_pattern = re.compile(r'(?:[^"{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*(?:(?P<brace>[{}])|(?P<partial>")|\Z)')
+_mod_pattern = re.compile(r'"mod"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"')
+
+
+class GameListParser:
+    """
+    Incremental parser for the master server's game list.
+
+    Splits the JSON array into its objects while the body is still arriving and only decodes
+    objects that mention one of the wanted mods, so games of other mods are never materialized.
+    """
+
+    def __init__(self, mods: set[str]):
+        self.mods = {mod.lower() for mod in mods}
+        self.games: list[dict] = []
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._object_start = 0
+
+    def feed(self, chunk: bytes):
+        self._buffer += self._decoder.decode(chunk)
+        self._scan()
+
+    def close(self) -> list[dict]:
+        self._buffer += self._decoder.decode(b"", final=True)
+        self._scan()
+        if self._depth != 0:
+            raise ValueError("Game list ended in the middle of an object.")
+        return self.games
+
+    def _scan(self):
+        buffer = self._buffer
+        while True:
+            match = _brace_pattern.match(buffer, self._position)
+            brace = match.group("brace")
+            if brace is None:
+                # end of the buffer or a string that continues in the next chunk, scan it again from its start
+                self._position = match.start("partial") if match.group("partial") else match.end()
+                break
+
+            if brace == "{":
+                if self._depth == 0:
+                    self._object_start = match.end() - 1
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._add_object(buffer[self._object_start:match.end()])
+            self._position = match.end()
+
+        # drop everything that has been consumed
+        keep_from = self._object_start if self._depth > 0 else self._position
+        self._buffer = buffer[keep_from:]
+        self._position -= keep_from
+        self._object_start -= keep_from
+
+    def _add_object(self, text: str):
+        # cheap text check first, the actual mod is checked after decoding
+        if not any(match.group(1).lower() in self.mods for match in _mod_pattern.finditer(text)):
+            return
+        game = json.loads(text)
+        if game.get("mod", "").lower() not in self.mods:
+            return
+        for key in unused_keys:
+            game.pop(key, None)
+        self.games.append(game)
+
+
+def _get_retry_delay(attempt: int) -> float:
+    # exponential backoff with full jitter
+    return random.uniform(0, retry_base_delay * 2 ** attempt)
+
+
+async def fetch_game_data() -> list:
+    """
+    Fetch the games of the configured mods from the master server.
+
+    The response is parsed while it streams in and only games of mod_names are kept. Sends If-None-Match/If-Modified-Since when the server provided validators and returns the
+    previous payload without parsing it again if the server answers 304 or the body did not change.
+    Timeouts, connection errors, 429 and 5xx responses are retried with jittered backoff. Raises
+    MasterServerError if there is no game list after the last retry, an outage is never reported
+    as a server without games.
+    """
+    global _etag, _last_modified, _last_digest, _last_data
+
+    if _session is None:
+        await open_session()
+
+    headers = {}
+    if _etag:
+        headers["If-None-Match"] = _etag
+    if _last_modified:
+        headers["If-Modified-Since"] = _last_modified
+
+    for attempt in range(max_retries + 1):
+        try:
+            async with _session.get(url, headers=headers) as resp:
+                if resp.status == 304:
+                    fetches.inc(result="not_modified")
+                    return _last_data
+
+                if resp.status == 200:
+                    parser = GameListParser(mod_names)
+                    body_hash = hashlib.sha1()
+                    body_size = 0
+                    async for chunk in resp.content.iter_chunked(64 * 1024):
+                        body_hash.update(chunk)
+                        body_size += len(chunk)
+                        parser.feed(chunk)
+                    games = parser.close()
+                    payload_bytes.observe(body_size)
+
+                    # keep handing out the previous list if the body did not change
+                    digest = body_hash.digest()
+                    if digest != _last_digest:
+                        _last_data = games
+                        _last_digest = digest
+                        fetches.inc(result="changed")
+                    else:
+                        fetches.inc(result="unchanged")
+                    _etag = resp.headers.get("ETag")
+                    _last_modified = resp.headers.get("Last-Modified")
+                    return _last_data
+
+                fetches.inc(result=f"http_{resp.status}")
+                if resp.status != 429 and resp.status < 500:
+                    raise MasterServerError(f"Failed to fetch data from openra.net: HTTP {resp.status}.")
+                logger.warning(f"Master server answered HTTP {resp.status} (attempt {attempt + 1}/{max_retries + 1}).")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            fetches.inc(result="connection_error")
+            logger.warning(f"Request to master server failed (attempt {attempt + 1}/{max_retries + 1}): {e!r}")
+
+        if attempt < max_retries:
+            await asyncio.sleep(_get_retry_delay(attempt))
+
+    raise MasterServerError(f"Failed to fetch data from openra.net after {max_retries + 1} attempts.")
+
+
+async def _refresh_snapshot() -> Snapshot:
+    global _snapshot, _last_failure
+    try:
+        games = await fetch_game_data()
+    except MasterServerError:
+        # the previous snapshot is kept, but not handed out as current any more
+        _last_failure = time.time()
+        raise
+    _snapshot = Snapshot(games=games, fetched_at=time.time())
+    _last_failure = None
+    return _snapshot
+
+
+def latest_snapshot() -> Snapshot | None:
+    # the last successfully fetched snapshot without refreshing it, also while the master server is down
+    return _snapshot
+
+
+def _clear_snapshot_task(task: asyncio.Task):
+    global _snapshot_task
+    if _snapshot_task is task:
+        _snapshot_task = None
+
+
+async def get_snapshot(max_age: float | None = None) -> Snapshot:
+    """
+    Return a snapshot of the mod's games that is at most `max_age` seconds old.
+
+    If the cached snapshot is too old, concurrent callers share a single request to the master server.
+    Raises MasterServerError if that request fails, or if the last one failed less than `max_age`
+    seconds ago, so an outage does not cause a request per caller.
+    """
+    global _snapshot_task
+    if max_age is None:
+        max_age = max_snapshot_age
+
+    if _last_failure is None:
+        if _snapshot is not None and _snapshot.age <= max_age:
+            return _snapshot
+    elif time.time() - _last_failure <= max_age:
+        raise MasterServerError("The last request to the master server failed.")
+
+    if _snapshot_task is None:
+        _snapshot_task = asyncio.ensure_future(_refresh_snapshot())
+        _snapshot_task.add_done_callback(_clear_snapshot_task)
+    # shield the shared request, so one cancelled caller does not cancel it for everyone else
+    return await asyncio.shield(_snapshot_task)
@@ -0,0 +1,207 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Histograms and counters are module-level objects of the modules that record them. All of them
+are listed in the registry, served on a local HTTP endpoint and summarized by the /metrics command.
+Observations can come from the database threads, so every metric has a lock.
+"""
+
+import contextlib
+import logging
+import os
+import threading
+import time
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the endpoint, it only listens on localhost unless METRICS_HOST is set
+metrics_host: str = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_port: int = int(os.getenv("METRICS_PORT", "0"))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(2 ** i for i in range(10, 26, 2))  # 1 KiB to 32 MiB
+
+_registry: list["Metric"] = []
+_runner: web.AppRunner | None = None
+
+
+def _label_key(labels: dict) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((name, str(label)) for name, label in labels.items()))
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [f"{self.name}{_format_labels(key)} {value:g}" for key, value in values]
+
+    def summary(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)}: {value:g}" for key, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = [counts, total + value]
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        # observes the duration of the block, also when it raises
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels) -> int:
+        values = self._values.get(_label_key(labels))
+        return sum(values[0]) if values else 0
+
+    def quantile(self, q: float, **labels) -> float | None:
+        # estimated like Prometheus' histogram_quantile, by interpolating inside the bucket
+        values = self._values.get(_label_key(labels))
+        return self._quantile(q, values[0]) if values else None
+
+    def _quantile(self, q: float, counts: list[int]) -> float | None:
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = super().render()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def summary(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            count = sum(counts)
+            lines.append(f"{self.name}{_format_labels(key)}: n={count} avg={total / count:.3g} "
+                         f"p50={self._quantile(0.5, counts):.3g} p99={self._quantile(0.99, counts):.3g}")
+        return lines
+
+
+class RateLimitLogHandler(logging.Handler):
+    """Counts the 429s that discord.py handles on its own, it only reports them in its log."""
+
+    def __init__(self, counter: Counter):
+        super().__init__(level=logging.WARNING)
+        self.counter = counter
+
+    def emit(self, record: logging.LogRecord):
+        message = record.getMessage()
+        if "rate limited" in message.lower():
+            self.counter.inc(scope="global" if "global" in message.lower() else "route")
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> list[str]:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.summary())
+    return lines
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_server(host: str | None = None, port: int | None = None):
+    global _runner
+    host = metrics_host if host is None else host
+    port = metrics_port if port is None else port
+    if not port or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+async def stop_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    # one live overview message per channel
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS overview_subscriptions (
+            channel_id INTEGER PRIMARY KEY,
+            guild_id INTEGER,
+            message_id INTEGER NOT NULL,
+            created_by INTEGER,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def get_subscriptions(conn: sqlite3.Connection) -> list[tuple[int, int]]:
+    # (channel_id, message_id) of every overview message
+    cursor = conn.cursor()
+    cursor.execute('SELECT channel_id, message_id FROM overview_subscriptions')
+    return cursor.fetchall()
+
+
+def get_subscription(conn: sqlite3.Connection, channel_id: int) -> int | None:
+    # message id of the overview in the channel
+    cursor = conn.cursor()
+    cursor.execute('SELECT message_id FROM overview_subscriptions WHERE channel_id = ?', (channel_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def add_subscription(conn: sqlite3.Connection, channel_id: int, guild_id: int | None, message_id: int,
+                     created_by: int | None = None):
+    # replaces the overview message of the channel if there already is one
+    conn.execute('''
+        INSERT OR REPLACE INTO overview_subscriptions (channel_id, guild_id, message_id, created_by, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (channel_id, guild_id, message_id, created_by, int(time.time())))
+
+
+def remove_subscriptions(conn: sqlite3.Connection, channel_ids: list[int]):
+    conn.executemany('DELETE FROM overview_subscriptions WHERE channel_id = ?', [(channel_id,) for channel_id in channel_ids])
@@ -0,0 +1,182 @@
+"""
+Searchable index of every human client name seen in the snapshots.
+
+Names are stored once with the first and last time they were seen. An FTS5 trigram index over a
+normalized form of the name (lowercase, letters and digits only) finds substrings in any position,
+so "xx_sniper" finds "[XX] Sniper". Queries shorter than three characters are too short for
+trigrams and use a prefix scan of the normalized names instead.
+
+The names seen in the last recent_days are also kept in memory, sorted, so autocomplete
+suggestions are answered without any database access.
+"""
+
+import bisect
+import heapq
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+recent_days: int = int(os.getenv("AUTOCOMPLETE_NAME_DAYS", "30"))
+
+# lowercase name -> (name, last_seen) of the recently seen players
+_recent_names: dict[str, tuple[str, int]] = {}
+# the keys of _recent_names in sorted order, for prefix lookups with bisect
+_sorted_names: list[str] = []
+# lowercase names in the newest snapshot
+_online_names: set[str] = set()
+
+
+def normalize_name(name: str) -> str:
+    return "".join(character for character in name.casefold() if character.isalnum())
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS player_names (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name_lower TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            search_key TEXT NOT NULL,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_names_search_key ON player_names(search_key)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_names_last_seen ON player_names(last_seen)')
+    # external content table, only the trigram index is stored
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS player_names_fts USING fts5(
+            search_key, content='player_names', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    # the search key never changes after the insert, so only inserts have to reach the index
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS player_names_fts_insert AFTER INSERT ON player_names BEGIN
+            INSERT INTO player_names_fts (rowid, search_key) VALUES (new.id, new.search_key);
+        END
+    ''')
+    conn.commit()
+
+    backfill_names(conn)
+
+
+def update_names(conn: sqlite3.Connection, snapshots: list[tuple[int, list[dict]]]) -> int:
+    """Add or refresh the names of a batch of (timestamp, games) snapshots, returns the number of distinct names."""
+    # name_lower -> [name, first_seen, last_seen], the spelling of the newest snapshot wins
+    seen = {}
+    for timestamp, games in sorted(snapshots, key=lambda snapshot: snapshot[0]):
+        for game in games:
+            for client in game.get("clients", []):
+                name = client.get("name", "")
+                if client.get("isbot", False) or not name:
+                    continue
+                entry = seen.get(name.lower())
+                if entry is None:
+                    seen[name.lower()] = [name, timestamp, timestamp]
+                else:
+                    entry[0] = name
+                    entry[2] = timestamp
+
+    conn.executemany('''
+        INSERT INTO player_names (name_lower, name, search_key, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (name_lower) DO UPDATE SET
+            name = CASE WHEN excluded.last_seen >= last_seen THEN excluded.name ELSE name END,
+            first_seen = MIN(first_seen, excluded.first_seen),
+            last_seen = MAX(last_seen, excluded.last_seen)
+    ''', [(name_lower, name, normalize_name(name), first_seen, last_seen)
+          for name_lower, (name, first_seen, last_seen) in seen.items()])
+    return len(seen)
+
+
+def backfill_names(conn: sqlite3.Connection) -> int:
+    # one-time fill from the player sessions, which hold every name of the stored snapshots
+    if conn.execute('SELECT 1 FROM player_names LIMIT 1').fetchone() is not None:
+        return 0
+    rows = conn.execute('SELECT name_lower, MIN(start_ts), MAX(end_ts) FROM player_sessions GROUP BY name_lower').fetchall()
+    # the sessions only know the lowercase names, the spelling is updated the next time a player is seen
+    conn.executemany('INSERT INTO player_names (name_lower, name, search_key, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)',
+                     [(name_lower, name_lower, normalize_name(name_lower), first_seen, last_seen)
+                      for name_lower, first_seen, last_seen in rows if name_lower])
+    conn.commit()
+    if rows:
+        logger.info(f"Indexed {len(rows)} player names from the player sessions.")
+    return len(rows)
+
+
+def search_names(conn: sqlite3.Connection, query: str, limit: int = 10) -> list[tuple[str, int]]:
+    """
+    Returns up to limit (name, last_seen) pairs matching the query.
+
+    Exact matches come first, then names starting with the query, then the remaining substring
+    matches, each ordered by the last time the player was seen.
+    """
+    search_key = normalize_name(query)
+    if not search_key:
+        return []
+    prefix_end = search_key + "\U0010ffff"
+    if len(search_key) < 3:
+        cursor = conn.execute('''
+            SELECT name, last_seen FROM player_names
+            WHERE search_key >= ? AND search_key < ?
+            ORDER BY search_key = ? DESC, last_seen DESC LIMIT ?
+        ''', (search_key, prefix_end, search_key, limit))
+        return cursor.fetchall()
+
+    cursor = conn.execute('''
+        SELECT player_names.name, player_names.last_seen FROM player_names_fts
+        JOIN player_names ON player_names.id = player_names_fts.rowid
+        WHERE player_names_fts MATCH ?
+        ORDER BY player_names.search_key = ? DESC,
+                 player_names.search_key >= ? AND player_names.search_key < ? DESC,
+                 player_names.last_seen DESC
+        LIMIT ?
+    ''', ('"' + search_key.replace('"', '""') + '"', search_key, search_key, prefix_end, limit))
+    return cursor.fetchall()
+
+
+def get_recent_names(conn: sqlite3.Connection, since: int) -> list[tuple[str, int]]:
+    cursor = conn.execute('SELECT name, last_seen FROM player_names WHERE last_seen >= ?', (since,))
+    return cursor.fetchall()
+
+
+def build_name_index(names: list[tuple[str, int]]):
+    _recent_names.clear()
+    _online_names.clear()
+    for name, last_seen in names:
+        _recent_names[name.lower()] = (name, last_seen)
+    _sorted_names[:] = sorted(_recent_names)
+
+
+def update_name_index(games: list[dict], timestamp: int):
+    # called with every fetched snapshot, new names are inserted in place to keep the list sorted
+    _online_names.clear()
+    for game in games:
+        for client in game.get("clients", []):
+            name = client.get("name", "")
+            if client.get("isbot", False) or not name:
+                continue
+            name_lower = name.lower()
+            if name_lower not in _recent_names:
+                bisect.insort(_sorted_names, name_lower)
+            _recent_names[name_lower] = (name, timestamp)
+            _online_names.add(name_lower)
+
+
+def prune_name_index(since: int):
+    expired = [name_lower for name_lower, (_, last_seen) in _recent_names.items() if last_seen < since]
+    for name_lower in expired:
+        del _recent_names[name_lower]
+    if expired:
+        _sorted_names[:] = sorted(_recent_names)
+
+
+def complete_name(prefix: str, limit: int = 25) -> list[str]:
+    """Names starting with the prefix, online players first, then by the last time they were seen."""
+    prefix = prefix.strip().lower()
+    start = bisect.bisect_left(_sorted_names, prefix)
+    end = bisect.bisect_left(_sorted_names, prefix + "\U0010ffff", lo=start)
+    matches = heapq.nlargest(limit, _sorted_names[start:end],
+                             key=lambda name_lower: (name_lower in _online_names, _recent_names[name_lower][1]))
+    return [_recent_names[name_lower][0] for name_lower in matches]
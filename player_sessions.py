@@ -0,0 +1,155 @@
+"""
+Player sessions derived from consecutive snapshots.
+
+A session is one player in one game (name and version) from the first to the last snapshot they
+were seen in. Every new batch of snapshots is diffed against the sessions that were still open at
+the previous snapshot: players that are still there extend their session, new players open one.
+If two snapshots are more than MAX_SESSION_GAP apart (the bot was offline), all sessions end at
+the last snapshot before the gap.
+"""
+
+import itertools
+import logging
+import sqlite3
+import sys
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+# seconds without a snapshot after which all open sessions are closed
+MAX_SESSION_GAP = 300
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS player_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name_lower TEXT NOT NULL,
+            game_name TEXT NOT NULL,
+            version TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_sessions_name ON player_sessions(name_lower, start_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_player_sessions_end ON player_sessions(end_ts)')
+    # timestamp of the newest snapshot that has been turned into sessions
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS player_sessions_watermark (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            timestamp INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+
+    backfill_sessions(conn)
+
+
+def get_watermark(conn: sqlite3.Connection) -> int | None:
+    row = conn.execute('SELECT timestamp FROM player_sessions_watermark WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+
+def get_session_keys(games: list[dict]) -> set[tuple[str, str, str]]:
+    # (name_lower, game_name, version) of every human client of a snapshot
+    return {(client.get("name", "").lower(), game.get("name", ""), game.get("version", ""))
+            for game in games for client in game.get("clients", []) if not client.get("isbot", False)}
+
+
+def update_sessions(conn: sqlite3.Connection, snapshots: list[tuple[int, list[dict]]]) -> int:
+    """
+    Extend, open and close sessions for a batch of (timestamp, games) snapshots.
+
+    Snapshots at or before the watermark are ignored, the sessions cannot be rebuilt out of order.
+    Of several snapshots with the same timestamp only the first one is used. Runs in the transaction
+    of the caller. Returns the number of snapshots used.
+    """
+    watermark = get_watermark(conn)
+    batch = sorted(snapshots, key=lambda snapshot: snapshot[0])
+    snapshots = []
+    for timestamp, games in batch:
+        if (watermark is None or timestamp > watermark) and (not snapshots or timestamp > snapshots[-1][0]):
+            snapshots.append((timestamp, games))
+    if not snapshots:
+        return 0
+
+    # session key -> [row id (None for new sessions), start_ts, end_ts]
+    open_sessions = {}
+    if watermark is not None:
+        cursor = conn.execute('SELECT id, name_lower, game_name, version, start_ts FROM player_sessions WHERE end_ts = ?',
+                              (watermark,))
+        open_sessions = {(name_lower, game_name, version): [row_id, start_ts, watermark]
+                         for row_id, name_lower, game_name, version, start_ts in cursor}
+    closed_sessions = []
+
+    last_timestamp = watermark
+    for timestamp, games in snapshots:
+        present = get_session_keys(games)
+        if last_timestamp is not None and timestamp - last_timestamp > MAX_SESSION_GAP:
+            closed_sessions.extend(open_sessions.items())
+            open_sessions = {}
+        for key in [key for key in open_sessions if key not in present]:
+            closed_sessions.append((key, open_sessions.pop(key)))
+        for key in present:
+            if key in open_sessions:
+                open_sessions[key][2] = timestamp
+            else:
+                open_sessions[key] = [None, timestamp, timestamp]
+        last_timestamp = timestamp
+
+    sessions = closed_sessions + list(open_sessions.items())
+    conn.executemany('UPDATE player_sessions SET end_ts = ? WHERE id = ?',
+                     [(end_ts, row_id) for _, (row_id, _, end_ts) in sessions if row_id is not None and end_ts != watermark])
+    conn.executemany('INSERT INTO player_sessions (name_lower, game_name, version, start_ts, end_ts) VALUES (?, ?, ?, ?, ?)',
+                     [(*key, start_ts, end_ts) for key, (row_id, start_ts, end_ts) in sessions if row_id is None])
+    conn.execute('INSERT OR REPLACE INTO player_sessions_watermark (id, timestamp) VALUES (1, ?)', (last_timestamp,))
+    return len(snapshots)
+
+
+def backfill_sessions(conn: sqlite3.Connection, batch_size: int = 1000) -> int:
+    # replays the stored snapshots after the watermark, one transaction per batch
+    watermark = get_watermark(conn)
+    start_timestamp = 0 if watermark is None else watermark + 1
+    after_id = 0
+    processed = 0
+    while True:
+        batch = list(itertools.islice(snapshot_store.iter_snapshots(conn, start_timestamp, 2 ** 62, after_id), batch_size))
+        if not batch:
+            break
+        after_id = batch[-1][0]
+        processed += update_sessions(conn, [(timestamp, games) for _, timestamp, games in batch])
+        conn.commit()
+        if processed and processed % (batch_size * 100) == 0:
+            logger.info(f"Built the player sessions of {processed} snapshots...")
+    if processed:
+        logger.info(f"Built the player sessions of {processed} stored snapshots.")
+    return processed
+
+
+def get_last_session(conn: sqlite3.Connection, name: str) -> tuple[str, str, int, int] | None:
+    # (game_name, version, start_ts, end_ts) of the newest session of the player
+    cursor = conn.execute('''
+        SELECT game_name, version, start_ts, end_ts FROM player_sessions
+        WHERE name_lower = ? ORDER BY start_ts DESC LIMIT 1
+    ''', (name.lower(),))
+    return cursor.fetchone()
+
+
+def get_play_time(conn: sqlite3.Connection, name: str, start_timestamp: int, end_timestamp: int) -> int:
+    # seconds the player was in a game within [start_timestamp, end_timestamp)
+    cursor = conn.execute('''
+        SELECT COALESCE(SUM(MIN(end_ts, ?) - MAX(start_ts, ?)), 0) FROM player_sessions
+        WHERE name_lower = ? AND start_ts < ? AND end_ts > ?
+    ''', (end_timestamp, start_timestamp, name.lower(), end_timestamp, start_timestamp))
+    return cursor.fetchone()[0]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sqlite_path = sys.argv[1] if len(sys.argv) > 1 else 'games_db.sqlite'
+    conn = sqlite3.connect(sqlite_path)
+    snapshot_store.ensure_schema(conn)
+    ensure_schema(conn)
+    count = conn.execute('SELECT COUNT(*) FROM player_sessions').fetchone()[0]
+    print(f"{count} player sessions up to {get_watermark(conn)}.")
+    conn.close()
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+
+# lowercase player name -> discord ids waiting for that player, mirrors the reminder_names table
+_subscribers: dict[str, set[int]] = {}
+# discord id -> lowercase player names, to clear all reminders of a user
+_names_by_user: dict[int, set[str]] = {}
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_names (
+            name_lower TEXT NOT NULL,
+            discord_id INTEGER NOT NULL,
+            PRIMARY KEY (name_lower, discord_id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_reminder_names_discord_id ON reminder_names(discord_id)')
+
+    # move reminders from the old one-row-per-user table (names as json list) over
+    cursor = conn.cursor()
+    cursor.execute('SELECT discord_id, names FROM reminders')
+    legacy_reminders = cursor.fetchall()
+    cursor.executemany('INSERT OR IGNORE INTO reminder_names (name_lower, discord_id) VALUES (?, ?)',
+                       [(name.lower(), discord_id) for discord_id, names in legacy_reminders for name in json.loads(names)])
+    cursor.execute('DELETE FROM reminders')
+    conn.commit()
+
+
+def get_all_reminder_names(conn: sqlite3.Connection) -> list[tuple[str, int]]:
+    cursor = conn.cursor()
+    cursor.execute('SELECT name_lower, discord_id FROM reminder_names')
+    return cursor.fetchall()
+
+
+def add_reminder_name(conn: sqlite3.Connection, discord_id: int, name: str) -> bool:
+    # returns False if the reminder was already set
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR IGNORE INTO reminder_names (name_lower, discord_id) VALUES (?, ?)',
+                   (name.lower(), discord_id))
+    return cursor.rowcount > 0
+
+
+def remove_reminder_names(conn: sqlite3.Connection, discord_id: int, names: list[str] | None = None):
+    # removes the given names or, without names, all reminders of the user
+    if names is None:
+        conn.execute('DELETE FROM reminder_names WHERE discord_id = ?', (discord_id,))
+    else:
+        conn.executemany('DELETE FROM reminder_names WHERE name_lower = ? AND discord_id = ?',
+                         [(name.lower(), discord_id) for name in names])
+
+
+def remove_matched_reminders(conn: sqlite3.Connection, matches: dict[int, list[str]]):
+    # removes every sent reminder of a tick at once
+    conn.executemany('DELETE FROM reminder_names WHERE name_lower = ? AND discord_id = ?',
+                     [(name.lower(), discord_id) for discord_id, names in matches.items() for name in names])
+
+
+def build_index(reminder_names: list[tuple[str, int]]):
+    _subscribers.clear()
+    _names_by_user.clear()
+    for name, discord_id in reminder_names:
+        index_reminder_name(discord_id, name)
+
+
+def index_reminder_name(discord_id: int, name: str):
+    name = name.lower()
+    _subscribers.setdefault(name, set()).add(discord_id)
+    _names_by_user.setdefault(discord_id, set()).add(name)
+
+
+def unindex_reminder_names(discord_id: int, names: list[str] | None = None):
+    user_names = _names_by_user.get(discord_id, set())
+    names = list(user_names) if names is None else [name.lower() for name in names]
+    for name in names:
+        user_names.discard(name)
+        subscribers = _subscribers.get(name)
+        if subscribers is not None:
+            subscribers.discard(discord_id)
+            if not subscribers:
+                del _subscribers[name]
+    if not user_names:
+        _names_by_user.pop(discord_id, None)
+
+
+def match_reminders(online_names: set[str]) -> dict[int, list[str]]:
+    """
+    Map every discord id with a reminder for one of the online players to the matched names.
+
+    Only looks up the online names in the index, so the cost does not depend on the number of reminders.
+    """
+    matches: dict[int, list[str]] = {}
+    for name in online_names:
+        for discord_id in _subscribers.get(name.lower(), ()):
+            matches.setdefault(discord_id, []).append(name.lower())
+    return matches
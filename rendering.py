@@ -0,0 +1,170 @@
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import io
+import logging
+import multiprocessing
+import os
+import time
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.ticker import MaxNLocator
+import matplotlib.dates as mdates
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# profile name -> (dpi, figure size in inches)
+PLOT_PROFILES = {
+    "high": (300, (12, 6)),
+    "medium": (150, (12, 6)),
+    "low": (100, (10, 5)),
+}
+
+plot_profile: str = os.getenv("PLOT_PROFILE", "high")
+render_workers: int = int(os.getenv("RENDER_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# charts waiting for or being rendered, further requests are rejected
+max_pending_renders: int = int(os.getenv("MAX_PENDING_RENDERS", str(render_workers * 4)))
+
+# rendered charts are kept until the memory cap is reached (least recently used first out) or they are too old
+chart_cache_max_bytes: int = int(os.getenv("CHART_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+chart_cache_max_age: float = float(os.getenv("CHART_CACHE_MAX_AGE", "300"))
+
+_pool: concurrent.futures.ProcessPoolExecutor | None = None
+_pending_renders: int = 0
+
+# cache key -> (creation time, png)
+_chart_cache: collections.OrderedDict[tuple, tuple[float, bytes]] = collections.OrderedDict()
+_chart_cache_bytes: int = 0
+
+
+class RenderQueueFullError(Exception):
+    pass
+
+
+def start():
+    global _pool
+    # spawn instead of fork, the bot process already runs database and event loop threads
+    _pool = concurrent.futures.ProcessPoolExecutor(max_workers=render_workers,
+                                                   mp_context=multiprocessing.get_context("spawn"))
+    logger.info(f"Started chart rendering pool with {render_workers} workers and profile {plot_profile}.")
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def create_plot(x_times, y_values, title, x_label, y_label, period="day", timezone="UTC", profile="high") -> bytes:
+    # runs inside a worker process and returns the rendered PNG
+    dpi, figsize = PLOT_PROFILES[profile]
+
+    # Convert x_times to the specified timezone
+    tz = pytz.timezone(timezone)
+    if x_times and isinstance(x_times[0], datetime.datetime):
+        x_times = [dt.astimezone(tz) for dt in x_times]
+
+    plt.style.use('seaborn-v0_8')
+    plt.figure(figsize=figsize, facecolor='white')
+    ax = plt.gca()
+
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+    # buckets without data are None, plot them as gaps
+    y_values = [float('nan') if y is None else y for y in y_values]
+    known_values = [y for y in y_values if y == y]
+
+    if known_values:  # Ensure there is at least one value
+        ax.set_ylim(bottom=0, top=max(max(known_values) * 1.1, 1))  # Start at 0, extend 10% above max for padding
+
+    if x_times:  # Ensure x_times is not empty
+        ax.set_xlim(left=min(x_times), right=max(x_times))
+
+    if period == "day":
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M", tz=pytz.timezone(timezone)))
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    elif period == "week":
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d %H:%M", tz=pytz.timezone(timezone)))
+        # only show midnight and noon
+        ax.xaxis.set_major_locator(mdates.HourLocator(byhour=[0, 12], interval=1))
+    elif period == "month":
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d", tz=pytz.timezone(timezone)))
+        ax.xaxis.set_major_locator(mdates.DayLocator(interval=2))
+    elif period == "year":
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m", tz=pytz.timezone(timezone)))
+        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=1))
+
+    plt.plot(x_times, y_values, color='#1f77b4', linewidth=2.5)
+    plt.title(f"{title}", fontsize=16, fontweight='bold', pad=15, color='#333333')  # Add timezone to title
+    plt.xlabel(f"{x_label} ({timezone})", fontsize=12, fontweight='medium', color='#333333')
+    plt.ylabel(y_label, fontsize=12, fontweight='medium', color='#333333')
+    plt.xticks(rotation=45, ha='right', fontsize=10, color='#333333')
+    plt.yticks(fontsize=10, color='#333333')
+    plt.grid(True, which='both', linestyle='--', linewidth=0.7, alpha=0.7, color='#cccccc')
+    ax.set_facecolor('#f5f5f5')
+    for spine in ax.spines.values():
+        spine.set_edgecolor('#cccccc')
+        spine.set_linewidth(1)
+    plt.tight_layout()
+    output = io.BytesIO()
+    plt.savefig(output, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close()
+    return output.getvalue()
+
+
+async def render_plot(x_times, y_values, title, x_label, y_label, period="day", timezone="UTC") -> io.BytesIO:
+    """
+    Render a chart with create_plot in the worker pool and return the PNG as an in-memory buffer.
+
+    Raises RenderQueueFullError if max_pending_renders charts are already queued.
+    """
+    global _pending_renders
+    if _pool is None:
+        start()
+    if _pending_renders >= max_pending_renders:
+        raise RenderQueueFullError(f"{_pending_renders} charts are already being rendered.")
+
+    _pending_renders += 1
+    try:
+        png = await asyncio.get_running_loop().run_in_executor(
+            _pool, create_plot, x_times, y_values, title, x_label, y_label, period, timezone, plot_profile)
+    finally:
+        _pending_renders -= 1
+    return io.BytesIO(png)
+
+
+def get_cached_chart(key: tuple) -> io.BytesIO | None:
+    global _chart_cache_bytes
+    entry = _chart_cache.get(key)
+    if entry is None:
+        return None
+
+    created, png = entry
+    if time.monotonic() - created > chart_cache_max_age:
+        del _chart_cache[key]
+        _chart_cache_bytes -= len(png)
+        return None
+
+    _chart_cache.move_to_end(key)
+    return io.BytesIO(png)
+
+
+def cache_chart(key: tuple, image: io.BytesIO):
+    global _chart_cache_bytes
+    png = image.getvalue()
+    if len(png) > chart_cache_max_bytes:
+        return
+
+    previous = _chart_cache.pop(key, None)
+    if previous is not None:
+        _chart_cache_bytes -= len(previous[1])
+    _chart_cache[key] = (time.monotonic(), png)
+    _chart_cache_bytes += len(png)
+
+    while _chart_cache_bytes > chart_cache_max_bytes:
+        _, (_, evicted) = _chart_cache.popitem(last=False)
+        _chart_cache_bytes -= len(evicted)
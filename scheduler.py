@@ -0,0 +1,71 @@
+"""
+Periodic jobs on a fixed wall-clock grid.
+
+A job with an interval of 60 seconds runs at :00 of every minute (plus its offset), no matter how
+long the previous run took, so the processing time never shifts the following runs. Missed slots
+are skipped instead of being caught up. Failed runs are retried with exponential backoff and
+jitter, the first successful retry puts the job back on its grid.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Awaitable, Callable
+import metrics
+
+logger = logging.getLogger(__name__)
+
+job_seconds = metrics.Histogram("bot_job_seconds", "Duration of the scheduled jobs.")
+job_lag_seconds = metrics.Histogram("bot_job_lag_seconds", "Delay between the deadline of a job and its start.")
+job_failures = metrics.Counter("bot_job_failures_total", "Scheduled job runs that raised an error.")
+
+
+def next_boundary(now: float, interval: float, offset: float = 0.0) -> float:
+    # first wall-clock time after now that is a multiple of interval, shifted by offset
+    return (math.floor((now - offset) / interval) + 1) * interval + offset
+
+
+def get_backoff_delay(failures: int, interval: float, max_backoff: float) -> float:
+    # doubles with every failure in a row, the jitter keeps retries of several jobs apart
+    delay = min(max_backoff, interval * 2 ** (failures - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def run_periodic(name: str, job: Callable[[], Awaitable], interval: float | Callable[[], float],
+                       offset: float = 0.0, max_backoff: float = 300.0, run_at_start: bool = False):
+    """
+    Run `job` on every boundary of `interval` seconds until the task is cancelled.
+
+    `interval` may be a function, it is asked again before every run, so a job can change its
+    cadence depending on what it saw.
+    """
+    get_interval = interval if callable(interval) else lambda: interval
+    loop = asyncio.get_running_loop()
+    failures = 0
+    target = time.time() if run_at_start else next_boundary(time.time(), get_interval(), offset)
+
+    while True:
+        # the wall-clock target becomes a deadline on the monotonic loop clock
+        deadline = loop.time() + (target - time.time())
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+        start = loop.time()
+        job_lag_seconds.observe(max(0.0, start - deadline), job=name)
+
+        try:
+            await job()
+            failures = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failures += 1
+            job_failures.inc(job=name)
+            logger.exception(f"Job {name} failed ({failures} in a row).")
+        job_seconds.observe(loop.time() - start, job=name)
+
+        current_interval = get_interval()
+        if failures:
+            target = time.time() + get_backoff_delay(failures, current_interval, max_backoff)
+        else:
+            target = next_boundary(time.time(), current_interval, offset)
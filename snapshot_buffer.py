@@ -0,0 +1,122 @@
+"""
+Write-behind buffer for the snapshots of the persist job.
+
+Snapshots are collected in memory and written in one transaction once flush_size snapshots are
+pending or the oldest one is flush_interval seconds old, so the database commits once per batch
+instead of once per sample. Every pending snapshot is also appended to a journal file, if the bot
+crashes before the flush, the batch is written on the next start. The journal is not fsynced, it
+covers crashes of the process, not of the machine.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import db
+import history
+import metrics
+
+logger = logging.getLogger(__name__)
+
+flush_size: int = int(os.getenv("SNAPSHOT_FLUSH_SIZE", "5"))
+flush_interval: float = float(os.getenv("SNAPSHOT_FLUSH_INTERVAL", "300"))
+journal_path: str = os.getenv("SNAPSHOT_JOURNAL", "snapshot_journal.jsonl")
+# if the database is unavailable for a long time, the oldest snapshots are dropped beyond this
+max_pending: int = 10000
+
+_pending: list[tuple[int, list[dict]]] = []
+_oldest_pending: float | None = None  # monotonic time the oldest pending snapshot was added
+_flush_lock = asyncio.Lock()
+
+flush_failures = metrics.Counter("bot_snapshot_flush_failures_total", "Writes of buffered snapshots that failed.")
+dropped_snapshots = metrics.Counter("bot_snapshots_dropped_total", "Buffered snapshots dropped because the buffer was full.")
+
+
+def _append_to_journal(timestamp: int, games: list[dict]):
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"timestamp": timestamp, "games": games}, separators=(",", ":")) + "\n")
+
+
+def _truncate_journal(remaining: list[tuple[int, list[dict]]]):
+    # rewrites the journal with the snapshots added while the flush ran
+    if not remaining:
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        return
+    temporary_path = journal_path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        for timestamp, games in remaining:
+            f.write(json.dumps({"timestamp": timestamp, "games": games}, separators=(",", ":")) + "\n")
+    os.replace(temporary_path, journal_path)
+
+
+def get_pending_count() -> int:
+    return len(_pending)
+
+
+def is_due() -> bool:
+    return bool(_pending) and (len(_pending) >= flush_size or time.monotonic() - _oldest_pending >= flush_interval)
+
+
+async def add(timestamp: int, games: list[dict]):
+    """Buffer a snapshot and flush the buffer if it is full or old enough."""
+    global _oldest_pending
+    # the journal is written off the event loop, the lock keeps appends and rewrites in order
+    async with _flush_lock:
+        await asyncio.to_thread(_append_to_journal, timestamp, games)
+        _pending.append((timestamp, games))
+        if _oldest_pending is None:
+            _oldest_pending = time.monotonic()
+
+        if len(_pending) > max_pending:
+            logger.warning(f"Dropping {len(_pending) - max_pending} buffered snapshots, the database is not writable.")
+            dropped_snapshots.inc(len(_pending) - max_pending)
+            del _pending[:len(_pending) - max_pending]
+
+    if is_due():
+        try:
+            await flush()
+        except Exception:
+            # already logged, the snapshots stay pending until the next flush
+            pass
+
+
+async def flush(skip_existing: bool = False) -> int:
+    """Write all pending snapshots in one transaction, returns the number of inserted snapshots."""
+    global _oldest_pending
+    async with _flush_lock:
+        if not _pending:
+            return 0
+        batch = list(_pending)
+        try:
+            inserted = await db.write(history.insert_snapshots, batch, skip_existing)
+        except Exception as e:
+            # the batch stays pending and in the journal, the next flush tries again
+            logger.error(f"Failed to write {len(batch)} buffered snapshots: {e}")
+            flush_failures.inc()
+            raise
+
+        del _pending[:len(batch)]
+        _oldest_pending = time.monotonic() if _pending else None
+        await asyncio.to_thread(_truncate_journal, list(_pending))
+        return inserted
+
+
+async def recover() -> int:
+    """Write the snapshots of a journal left behind by a crash, returns the number of recovered snapshots."""
+    if not os.path.exists(journal_path):
+        return 0
+    with open(journal_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be cut off by the crash
+                continue
+            _pending.append((entry["timestamp"], entry["games"]))
+
+    # the crash may have happened after the batch was committed but before the journal was cleared
+    recovered = await flush(skip_existing=True)
+    logger.info(f"Recovered {recovered} buffered snapshots from {journal_path}.")
+    return recovered
@@ -0,0 +1,261 @@
+"""
+Deduplicated, compressed storage for the game lists of the games table.
+
+Every game record is stored once in game_records, keyed by the sha1 of its canonical json and
+compressed with zlib. A snapshot row in games only keeps the concatenated 20 byte hashes of its
+games in game_hashes, so games that did not change between two snapshots cost 20 bytes. Fields
+that change on every fetch of a running game (VOLATILE_FIELDS, the playtime) are replaced by null
+in the record and stored per row in game_volatile, otherwise a started game would need a new record
+every minute. Rows written before this format still carry their json in games_data and are read
+transparently.
+"""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import zlib
+
+HASH_SIZE = 20
+# values of these fields are stored per snapshot row instead of in the records, in this order
+VOLATILE_FIELDS = ("playtime",)
+# format version of the compressed records, stored as their first byte
+RECORD_FORMAT = b"\x01"
+# preset dictionary with the keys of a game entry, improves compression of the small records
+# never change it for RECORD_FORMAT 1, the existing records can only be decompressed with it
+_ZDICT = json.dumps({
+    "address": "", "authentication": False, "bots": 0, "clients": [{
+        "color": "", "faction": "", "fingerprint": "", "isadmin": False, "isbot": False,
+        "isspectator": False, "name": "", "spawnpoint": 0, "team": 0}],
+    "id": 0, "location": "", "map": "", "maxplayers": 0, "mod": "ca", "name": "", "orders": 0,
+    "players": 0, "playtime": -1, "protected": False, "spectators": 0, "started": "", "state": 1,
+    "ttl": 0, "version": "",
+}, sort_keys=True, separators=(",", ":")).encode()
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS game_records (
+            hash BLOB PRIMARY KEY,
+            data BLOB NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA table_info(game_records)')
+    if "last_seen" not in {row[1] for row in cursor.fetchall()}:
+        # timestamp of the newest snapshot using the record, records not seen since a pruned range can be deleted
+        cursor.execute('ALTER TABLE game_records ADD COLUMN last_seen INTEGER')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_game_records_last_seen ON game_records(last_seen)')
+
+    cursor.execute('PRAGMA table_info(games)')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    if "game_hashes" not in existing_columns:
+        cursor.execute('ALTER TABLE games ADD COLUMN game_hashes BLOB')
+    if "game_volatile" not in existing_columns:
+        # json list with the VOLATILE_FIELDS values of the games, NULL for rows without any
+        cursor.execute('ALTER TABLE games ADD COLUMN game_volatile TEXT')
+    conn.commit()
+
+
+def _compress(text: bytes) -> bytes:
+    compressor = zlib.compressobj(level=9, zdict=_ZDICT)
+    return RECORD_FORMAT + compressor.compress(text) + compressor.flush()
+
+
+def _decompress(data: bytes) -> bytes:
+    if data[:1] != RECORD_FORMAT:
+        raise ValueError(f"Unknown game record format {data[:1]!r}.")
+    decompressor = zlib.decompressobj(zdict=_ZDICT)
+    return decompressor.decompress(data[1:]) + decompressor.flush()
+
+
+def store_game_records(conn: sqlite3.Connection, games: list[dict], timestamp: int) -> tuple[bytes, str | None]:
+    # stores the games that are not known yet and returns the values for games.game_hashes and games.game_volatile
+    return store_game_records_batch(conn, [(timestamp, games)])[0]
+
+
+def store_game_records_batch(conn: sqlite3.Connection, snapshots: list[tuple[int, list[dict]]]) -> list[tuple[bytes, str | None]]:
+    # like store_game_records for several snapshots, with one lookup and one insert for all of them
+    records: dict[bytes, bytes] = {}
+    last_seen: dict[bytes, int] = {}
+    snapshot_rows = []
+    for timestamp, games in snapshots:
+        hashes = []
+        volatile_values = []
+        for game in games:
+            record = game
+            present = [field for field in VOLATILE_FIELDS if field in game]
+            if present:
+                volatile_values.extend(game[field] for field in present)
+                record = {**game, **{field: None for field in present}}
+            text = json.dumps(record, sort_keys=True, separators=(",", ":")).encode()
+            record_hash = hashlib.sha1(text).digest()
+            records[record_hash] = text
+            last_seen[record_hash] = max(timestamp, last_seen.get(record_hash, timestamp))
+            hashes.append(record_hash)
+        volatile = json.dumps(volatile_values, separators=(",", ":")) if volatile_values else None
+        snapshot_rows.append((b"".join(hashes), volatile))
+
+    cursor = conn.cursor()
+    distinct_hashes = list(records)
+    known_hashes = set()
+    for i in range(0, len(distinct_hashes), 500):
+        batch = distinct_hashes[i:i + 500]
+        cursor.execute(f'SELECT hash FROM game_records WHERE hash IN ({", ".join("?" * len(batch))})', batch)
+        known_hashes.update(row[0] for row in cursor.fetchall())
+
+    cursor.executemany('INSERT OR IGNORE INTO game_records (hash, data, last_seen) VALUES (?, ?, ?)',
+                       [(record_hash, _compress(text), last_seen[record_hash]) for record_hash, text in records.items()
+                        if record_hash not in known_hashes])
+    cursor.executemany('UPDATE game_records SET last_seen = MAX(COALESCE(last_seen, 0), ?) WHERE hash = ?',
+                       [(last_seen[record_hash], record_hash) for record_hash in known_hashes])
+    return snapshot_rows
+
+
+class SnapshotReader:
+    """
+    Rebuilds game lists from games rows of either format.
+
+    Decompressed records are cached, so reading many consecutive snapshots only decompresses every
+    distinct game once. The returned games are fresh dicts and may be modified by the caller.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, cache_size: int = 4096):
+        self.conn = conn
+        self.cache_size = cache_size
+        self._records: dict[bytes, bytes] = {}
+        # consecutive snapshots are often identical, remember the last rebuilt list
+        self._last_game_hashes: bytes | None = None
+        self._last_text = b"[]"
+
+    def decode(self, games_data: str, game_hashes: bytes | None, game_volatile: str | None = None) -> list[dict]:
+        if game_hashes is None:
+            return json.loads(games_data)
+        if game_hashes == self._last_game_hashes:
+            return self._restore_volatile(json.loads(self._last_text), game_volatile)
+
+        hashes = [game_hashes[i:i + HASH_SIZE] for i in range(0, len(game_hashes), HASH_SIZE)]
+        missing = [record_hash for record_hash in set(hashes) if record_hash not in self._records]
+        if missing:
+            if len(self._records) + len(missing) > self.cache_size:
+                # records of this snapshot that were cached before the clear are loaded again
+                self._records.clear()
+                missing = list(set(hashes))
+            cursor = self.conn.cursor()
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                cursor.execute(f'SELECT hash, data FROM game_records WHERE hash IN ({", ".join("?" * len(batch))})', batch)
+                for record_hash, data in cursor.fetchall():
+                    self._records[record_hash] = _decompress(data)
+
+        # one json.loads for the whole list is a lot faster than one per game
+        self._last_game_hashes = game_hashes
+        self._last_text = b"[" + b",".join(self._records[record_hash] for record_hash in hashes) + b"]"
+        return self._restore_volatile(json.loads(self._last_text), game_volatile)
+
+    @staticmethod
+    def _restore_volatile(games: list[dict], game_volatile: str | None) -> list[dict]:
+        # records written before VOLATILE_FIELDS still hold the values themselves, their rows have no game_volatile
+        if game_volatile is None:
+            return games
+        values = iter(json.loads(game_volatile))
+        for game in games:
+            for field in VOLATILE_FIELDS:
+                if field in game:
+                    game[field] = next(values)
+        return games
+
+
+def load_snapshot(conn: sqlite3.Connection, timestamp: int) -> tuple[int, list[dict]] | None:
+    # the newest snapshot taken at or before the timestamp
+    cursor = conn.cursor()
+    cursor.execute('SELECT timestamp, games_data, game_hashes, game_volatile FROM games WHERE timestamp <= ? ORDER BY timestamp DESC LIMIT 1',
+                   (timestamp,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0], SnapshotReader(conn).decode(*row[1:])
+
+
+def iter_snapshots(conn: sqlite3.Connection, start_timestamp: int, end_timestamp: int, after_id: int = 0):
+    # yields (id, timestamp, games) of all snapshots in [start_timestamp, end_timestamp) in insertion order
+    reader = SnapshotReader(conn)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, timestamp, games_data, game_hashes, game_volatile FROM games
+        WHERE timestamp >= ? AND timestamp < ? AND id > ?
+        ORDER BY id
+    ''', (start_timestamp, end_timestamp, after_id))
+    for row_id, timestamp, games_data, game_hashes, game_volatile in cursor:
+        yield row_id, timestamp, reader.decode(games_data, game_hashes, game_volatile)
+
+
+def migrate_games_table(conn: sqlite3.Connection, batch_size: int = 1000) -> int:
+    # converts rows that still store their json in games_data, one transaction per batch
+    migrated = 0
+    cursor = conn.cursor()
+    while True:
+        cursor.execute('SELECT id, timestamp, games_data FROM games WHERE game_hashes IS NULL LIMIT ?', (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        updates = [(*store_game_records(conn, json.loads(games_data), timestamp), row_id) for row_id, timestamp, games_data in rows]
+        cursor.executemany("UPDATE games SET game_hashes = ?, game_volatile = ?, games_data = '' WHERE id = ?", updates)
+        conn.commit()
+        migrated += len(rows)
+        print(f"Migrated {migrated} snapshots...")
+    return migrated
+
+
+def delete_unused_game_records(conn: sqlite3.Connection, cutoff: int, batch_size: int = 5000) -> int:
+    # only valid once every snapshot before the cutoff is deleted, returns the number of deleted records
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM game_records WHERE hash IN (SELECT hash FROM game_records WHERE last_seen < ? LIMIT ?)',
+                   (cutoff, batch_size))
+    return cursor.rowcount
+
+
+def get_storage_size(conn: sqlite3.Connection) -> int:
+    # bytes used by the snapshot payloads in both formats
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COALESCE(SUM(LENGTH(games_data)), 0) + COALESCE(SUM(LENGTH(game_hashes)), 0) + COALESCE(SUM(LENGTH(game_volatile)), 0)
+        FROM games
+    ''')
+    games_size = cursor.fetchone()[0]
+    cursor.execute('SELECT COALESCE(SUM(LENGTH(hash)) + SUM(LENGTH(data)), 0) FROM game_records')
+    return games_size + cursor.fetchone()[0]
+
+
+def time_full_scan(conn: sqlite3.Connection) -> tuple[int, float]:
+    # number of snapshots and seconds needed to rebuild every snapshot
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_snapshots(conn, 0, 2 ** 62))
+    return count, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    sqlite_path = sys.argv[1] if len(sys.argv) > 1 else 'games_db.sqlite'
+    conn = sqlite3.connect(sqlite_path)
+    ensure_schema(conn)
+
+    size_before = get_storage_size(conn)
+    count, scan_before = time_full_scan(conn)
+    print(f"Before: {size_before / 1e6:.1f} MB snapshot data, full scan of {count} snapshots in {scan_before:.2f}s")
+
+    migrated = migrate_games_table(conn)
+
+    size_after = get_storage_size(conn)
+    count, scan_after = time_full_scan(conn)
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM game_records')
+    record_count = cursor.fetchone()[0]
+    print(f"Migrated {migrated} snapshots, {record_count} distinct game records.")
+    print(f"After: {size_after / 1e6:.1f} MB snapshot data, full scan of {count} snapshots in {scan_after:.2f}s")
+    if size_after:
+        print(f"Size reduced by a factor of {size_before / size_after:.1f}.")
+
+    print("Running VACUUM to give the freed pages back to the file system...")
+    conn.execute('VACUUM')
+    conn.close()
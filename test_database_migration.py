@@ -0,0 +1,100 @@
+import unittest
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+import database_migration
+import history
+
+
+def create_games(*players):
+    return [{"name": "game", "version": "1.06", "players": len(players), "clients": [{"name": player} for player in players]}]
+
+
+def write_tinydb(path, snapshots, reminders=(), averages=()):
+    data = {
+        "_default": {str(i + 1): {"timestamp": timestamp, "games": games} for i, (timestamp, games) in enumerate(snapshots)},
+        "reminders": {str(i + 1): {"discord_id": discord_id, "names": names} for i, (discord_id, names) in enumerate(reminders)},
+        "avg_hourly_player_count": {str(i + 1): {"timestamp": timestamp, "average_players": average}
+                                    for i, (timestamp, average) in enumerate(averages)},
+    }
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+class TestTinyDBReader(unittest.TestCase):
+    def test_documents_are_streamed_across_chunks(self):
+        text = json.dumps({"_default": {"1": {"timestamp": 60, "games": [{"name": "a \" {"}]}, "2": {}}, "empty": {},
+                           "reminders": {"1": {"discord_id": 5, "names": ["x"]}}}, indent=1)
+        documents = list(database_migration.TinyDBReader(io.StringIO(text), chunk_size=7))
+
+        self.assertEqual(documents, [
+            ("_default", 1, {"timestamp": 60, "games": [{"name": "a \" {"}]}),
+            ("_default", 2, {}),
+            ("reminders", 1, {"discord_id": 5, "names": ["x"]}),
+        ])
+        self.assertEqual(list(database_migration.TinyDBReader(io.StringIO(""))), [])
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tinydb_path = os.path.join(self.directory.name, "games_db.json")
+        self.sqlite_path = os.path.join(self.directory.name, "games_db.sqlite")
+        # a few hours in the past, so the hours are closed and rolled up
+        self.start = 1700000000 - 1700000000 % history.HOUR
+        self.snapshots = [(self.start + 60 * i, create_games("Alice", "Bob") if i < 5 else create_games("Alice")) for i in range(10)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_rows(self, query):
+        conn = sqlite3.connect(self.sqlite_path)
+        try:
+            return conn.execute(query).fetchall()
+        finally:
+            conn.close()
+
+    def test_migration_fills_every_table(self):
+        write_tinydb(self.tinydb_path, self.snapshots, reminders=[(1, ["Alice", "bob"])],
+                     averages=[(self.start, 100.0), (self.start - history.HOUR, 7.0)])
+        counts = database_migration.migrate_tinydb_to_sqlite(self.tinydb_path, self.sqlite_path, chunk_size=3)
+
+        self.assertEqual(counts, {"_default": 10, "reminders": 1, "avg_hourly_player_count": 2})
+        self.assertEqual(self.get_rows('SELECT COUNT(*), SUM(human_clients) FROM games'), [(10, 15)])
+        self.assertEqual(self.get_rows('SELECT name_lower, start_ts, end_ts FROM player_sessions ORDER BY name_lower'),
+                         [("alice", self.start, self.start + 540), ("bob", self.start, self.start + 240)])
+        self.assertEqual(self.get_rows('SELECT name_lower, discord_id FROM reminder_names ORDER BY name_lower'),
+                         [("alice", 1), ("bob", 1)])
+        # the hour with snapshots is rolled up, the legacy average only fills the hour before
+        self.assertEqual(self.get_rows('SELECT timestamp, average_players FROM avg_hourly_player_count ORDER BY timestamp'),
+                         [(self.start - history.HOUR, 7.0), (self.start, 1.5)])
+        indexes = {row[0] for row in self.get_rows("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue(set(database_migration.DEFERRED_INDEXES) <= indexes)
+
+    def test_interrupted_migration_resumes(self):
+        write_tinydb(self.tinydb_path, self.snapshots)
+        insert_snapshots = history.insert_snapshots
+        calls = []
+
+        def fail_on_third_chunk(conn, snapshots, *args):
+            calls.append(len(snapshots))
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return insert_snapshots(conn, snapshots, *args)
+
+        with mock.patch.object(history, "insert_snapshots", fail_on_third_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                database_migration.migrate_tinydb_to_sqlite(self.tinydb_path, self.sqlite_path, chunk_size=3, run_rollups=False)
+        self.assertEqual(self.get_rows('SELECT COUNT(*) FROM games'), [(6,)])
+
+        counts = database_migration.migrate_tinydb_to_sqlite(self.tinydb_path, self.sqlite_path, chunk_size=3, run_rollups=False)
+        self.assertEqual(counts["_default"], 4)
+        self.assertEqual(self.get_rows('SELECT COUNT(*) FROM games'), [(10,)])
+        self.assertEqual(self.get_rows('SELECT COUNT(*) FROM player_sessions'), [(2,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import threading
+import db
+import history
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        db.init(os.path.join(self.directory.name, 'games_db.sqlite'))
+
+    def tearDown(self):
+        db.close()
+        self.directory.cleanup()
+
+    def test_writes_are_visible_to_readers(self):
+        async def run():
+            await db.write(history.insert_snapshot, 60, [{"name": "game", "players": 3}])
+            return await db.read(history.get_average_player_count_buckets, 0, history.HOUR, 1)
+
+        self.assertEqual(asyncio.run(run()), [3.0])
+
+    def test_writes_run_on_a_single_thread_in_wal_mode(self):
+        def get_thread_and_journal_mode(conn):
+            return threading.current_thread().name, conn.execute('PRAGMA journal_mode').fetchone()[0]
+
+        async def run():
+            return await asyncio.gather(*[db.write(get_thread_and_journal_mode) for _ in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(len({thread for thread, _ in results}), 1)
+        self.assertEqual({mode for _, mode in results}, {"wal"})
+
+    def test_failed_writes_are_rolled_back(self):
+        def insert_and_fail(conn):
+            history.insert_snapshot(conn, 60, [])
+            raise ValueError("failed")
+
+        async def run():
+            with self.assertRaises(ValueError):
+                await db.write(insert_and_fail)
+            return await db.read(lambda conn: conn.execute('SELECT COUNT(*) FROM games').fetchone()[0])
+
+        self.assertEqual(asyncio.run(run()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+import game_versions
+from packaging import version
+
+
+class TestClassifyVersion(unittest.TestCase):
+    def test_tags(self):
+        self.assertEqual(game_versions.classify_version("1.06.2").tag, game_versions.NORMAL)
+        self.assertEqual(game_versions.classify_version("devtest-20240101").tag, game_versions.DEVTEST)
+        self.assertEqual(game_versions.classify_version("1.07-PRE3").tag, game_versions.PRERELEASE)
+        self.assertEqual(game_versions.classify_version("release-20231010").tag, game_versions.LEGACY)
+        self.assertEqual(game_versions.classify_version("").tag, game_versions.LEGACY)
+
+    def test_leading_v_is_removed(self):
+        info = game_versions.classify_version("v1.05")
+
+        self.assertEqual(info.name, "1.05")
+        self.assertEqual(info.parsed, version.parse("1.05"))
+
+    def test_results_are_cached(self):
+        self.assertIs(game_versions.classify_version("1.06.2"), game_versions.classify_version("1.06.2"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+import sqlite3
+import json
+import datetime
+import os
+import tempfile
+import db
+import history
+
+
+def create_snapshot_games(player_counts):
+    return [{"name": f"game {i}", "mod": "ca", "players": players, "state": 1 + i % 2,
+             "clients": [{"name": f"player {j}", "isbot": j == 0} for j in range(players)]}
+            for i, players in enumerate(player_counts)]
+
+
+def insert_snapshot(conn, timestamp, player_counts):
+    history.insert_snapshot(conn, timestamp, create_snapshot_games(player_counts))
+
+
+class TestAveragePlayerCountBuckets(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        history.ensure_schema(self.conn)
+        self.start = int(datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_buckets_are_averaged_and_gaps_are_none(self):
+        insert_snapshot(self.conn, self.start, [2, 4])
+        insert_snapshot(self.conn, self.start + 60, [2])
+        insert_snapshot(self.conn, self.start + 2 * history.HOUR + 59, [])
+
+        averages = history.get_average_player_count_buckets(self.conn, self.start, history.HOUR, 4)
+
+        self.assertEqual(averages, [4.0, None, 0.0, None])
+
+    def test_snapshots_outside_of_the_range_are_ignored(self):
+        insert_snapshot(self.conn, self.start - 1, [10])
+        insert_snapshot(self.conn, self.start + history.DAY, [10])
+        insert_snapshot(self.conn, self.start + history.DAY - 1, [3])
+
+        averages = history.get_average_player_count_buckets(self.conn, self.start, history.DAY, 1)
+
+        self.assertEqual(averages, [3.0])
+
+    def test_series_ends_with_the_current_bucket(self):
+        now = datetime.datetime.fromtimestamp(self.start + 30 * 60, tz=datetime.timezone.utc)
+        insert_snapshot(self.conn, self.start + 60, [5])
+
+        bucket_times, averages = history.get_average_player_count_series(self.conn, "day", now=now)
+
+        self.assertEqual(len(bucket_times), 24)
+        self.assertEqual(bucket_times[-1], datetime.datetime.fromtimestamp(self.start, tz=datetime.timezone.utc))
+        self.assertEqual(bucket_times[-1] - bucket_times[-2], datetime.timedelta(hours=1))
+        self.assertEqual(averages[-1], 5.0)
+        self.assertIsNone(averages[0])
+
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        history.ensure_schema(self.conn)
+        self.start = int(datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_only_closed_buckets_are_rolled_up(self):
+        insert_snapshot(self.conn, self.start + 60, [2])
+        insert_snapshot(self.conn, self.start + 120, [6])
+        insert_snapshot(self.conn, self.start + history.HOUR + 60, [1])
+        now = datetime.datetime.fromtimestamp(self.start + history.HOUR + 120, tz=datetime.timezone.utc)
+
+        inserted_entries = history.update_rollups(self.conn, now=now)
+
+        self.assertEqual(inserted_entries, {"avg_hourly_player_count": 1, "avg_daily_player_count": 0})
+        rows = self.conn.execute('SELECT timestamp, average_players, min_players, max_players, sample_count '
+                                 'FROM avg_hourly_player_count').fetchall()
+        self.assertEqual(rows, [(self.start, 4.0, 2, 6, 2)])
+        self.assertEqual(history.get_rollup_watermark(self.conn, "avg_hourly_player_count"), self.start + history.HOUR)
+
+    def test_rollups_resume_from_the_watermark(self):
+        insert_snapshot(self.conn, self.start + 60, [2])
+        history.update_rollups(self.conn, now=datetime.datetime.fromtimestamp(self.start + history.HOUR, tz=datetime.timezone.utc))
+        insert_snapshot(self.conn, self.start + history.HOUR + 60, [4])
+
+        inserted_entries = history.update_rollups(self.conn, now=datetime.datetime.fromtimestamp(
+            self.start + 3 * history.HOUR, tz=datetime.timezone.utc))
+
+        self.assertEqual(inserted_entries["avg_hourly_player_count"], 1)
+        rows = self.conn.execute('SELECT timestamp, average_players FROM avg_hourly_player_count ORDER BY timestamp').fetchall()
+        self.assertEqual(rows, [(self.start, 2.0), (self.start + history.HOUR, 4.0)])
+
+    def test_series_reads_rollups_and_the_current_bucket(self):
+        insert_snapshot(self.conn, self.start - history.DAY + 60, [10])
+        insert_snapshot(self.conn, self.start + 60, [3])
+        now = datetime.datetime.fromtimestamp(self.start + 120, tz=datetime.timezone.utc)
+        history.update_rollups(self.conn, now=now)
+        # rolled up buckets are not recomputed from the raw snapshots
+        self.conn.execute('UPDATE avg_daily_player_count SET average_players = 7')
+
+        bucket_times, averages = history.get_average_player_count_series(self.conn, "month", now=now)
+
+        self.assertEqual(averages[-2:], [7.0, 3.0])
+        self.assertEqual(averages[:-2], [None] * 28)
+
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        history.ensure_schema(self.conn)
+        self.start = int(datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc).timestamp())
+        self.now = datetime.datetime.fromtimestamp(self.start + 10 * history.DAY, tz=datetime.timezone.utc)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_cutoff_never_passes_the_rollup_watermarks(self):
+        self.assertEqual(history.get_retention_cutoff(self.conn, 2, now=self.now), 0)
+
+        insert_snapshot(self.conn, self.start, [1])
+        history.update_rollups(self.conn, now=self.now - datetime.timedelta(days=5))
+
+        self.assertEqual(history.get_retention_cutoff(self.conn, 2, now=self.now), self.start + 5 * history.DAY)
+        history.update_rollups(self.conn, now=self.now)
+        self.assertEqual(history.get_retention_cutoff(self.conn, 2, now=self.now), self.start + 8 * history.DAY)
+
+    def test_old_snapshots_and_their_records_are_pruned_in_batches(self):
+        for day in range(10):
+            insert_snapshot(self.conn, self.start + day * history.DAY, [day])
+        history.update_rollups(self.conn, now=self.now)
+        cutoff = history.get_retention_cutoff(self.conn, 2, now=self.now)
+
+        deleted = [history.prune_raw_snapshots(self.conn, cutoff, batch_size=5) for _ in range(5)]
+
+        # 8 snapshots, then the 8 records only they used
+        self.assertEqual(deleted, [5, 5, 5, 1, 0])
+        self.assertEqual(self.conn.execute('SELECT MIN(timestamp) FROM games').fetchone()[0], self.start + 8 * history.DAY)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM game_records').fetchone()[0], 2)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM avg_daily_player_count').fetchone()[0], 10)
+
+
+class TestIncrementalVacuum(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.conn = db.connect(os.path.join(self.directory.name, "games_db.sqlite"))
+        self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self.conn.execute('VACUUM')
+
+    def tearDown(self):
+        self.conn.close()
+        self.directory.cleanup()
+
+    def test_the_requested_number_of_pages_is_freed(self):
+        self.conn.execute('CREATE TABLE blobs (data BLOB)')
+        self.conn.executemany('INSERT INTO blobs (data) VALUES (?)', [(os.urandom(4096),) for _ in range(100)])
+        self.conn.commit()
+        self.conn.execute('DELETE FROM blobs')
+        self.conn.commit()
+        free_pages = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        self.assertGreater(free_pages, 50)
+
+        self.assertEqual(db.incremental_vacuum(self.conn, 20), free_pages - 20)
+        self.assertEqual(db.incremental_vacuum(self.conn, free_pages), 0)
+
+
+class TestSnapshotMetrics(unittest.TestCase):
+    def test_compute_snapshot_metrics(self):
+        games = create_snapshot_games([3, 0, 2])
+
+        self.assertEqual(history.compute_snapshot_metrics(games), (5, 2, 3, 2, 1))
+
+    def test_backfill_fills_old_snapshots(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute('''
+            CREATE TABLE games (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                games_data TEXT NOT NULL
+            )
+        ''')
+        conn.execute('INSERT INTO games (timestamp, games_data) VALUES (?, ?)', (0, json.dumps(create_snapshot_games([3, 0, 2]))))
+        conn.execute('INSERT INTO games (timestamp, games_data) VALUES (?, ?)', (60, json.dumps([])))
+
+        history.ensure_schema(conn)
+
+        rows = conn.execute(f'SELECT {", ".join(history.SNAPSHOT_METRICS)} FROM games ORDER BY timestamp').fetchall()
+        self.assertEqual(rows, [(5, 2, 3, 2, 1), (0, 0, 0, 0, 0)])
+        self.assertEqual(history.backfill_snapshot_metrics(conn), 0)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
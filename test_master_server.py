@@ -0,0 +1,137 @@
+import unittest
+import asyncio
+import json
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import master_server
+
+
+GAMES = [{"name": "game", "mod": "ca", "players": 2}]
+
+PAYLOAD = json.dumps([
+    {"name": "ra game {with braces}", "mod": "ra", "players": 1, "clients": [{"name": "\"quoted\" \\"}]},
+    {"name": "ca game", "mod": "ca", "players": 2, "modwebsite": "https://example.com", "modicon32": "...",
+     "clients": [{"name": "Müller {}", "isbot": False}, {"name": "bot", "isbot": True}]},
+    {"name": "says \"mod\": \"ca\"", "mod": "d2k", "players": 0, "clients": []},
+    {"name": "upper", "mod": "CA", "players": 0, "clients": []},
+], ensure_ascii=False).encode()
+
+
+class TestGameListParser(unittest.TestCase):
+    def test_only_games_of_the_mod_are_kept(self):
+        parser = master_server.GameListParser({"ca"})
+        parser.feed(PAYLOAD)
+
+        games = parser.close()
+
+        self.assertEqual([game["name"] for game in games], ["ca game", "upper"])
+        self.assertNotIn("modwebsite", games[0])
+        self.assertNotIn("modicon32", games[0])
+        self.assertEqual(games[0]["clients"][0]["name"], "Müller {}")
+
+    def test_chunk_boundaries_do_not_matter(self):
+        expected = master_server.GameListParser({"ca"})
+        expected.feed(PAYLOAD)
+        expected_games = expected.close()
+
+        for chunk_size in range(1, 40):
+            parser = master_server.GameListParser({"ca"})
+            for i in range(0, len(PAYLOAD), chunk_size):
+                parser.feed(PAYLOAD[i:i + chunk_size])
+            self.assertEqual(parser.close(), expected_games, f"chunk size {chunk_size}")
+
+    def test_truncated_payloads_are_rejected(self):
+        parser = master_server.GameListParser({"ca"})
+        parser.feed(PAYLOAD[:-10])
+
+        with self.assertRaises(ValueError):
+            parser.close()
+
+
+class TestFetchGameData(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests = []
+        self.responses = []
+
+        async def handler(request):
+            self.requests.append(request)
+            return self.responses.pop(0)
+
+        app = web.Application()
+        app.router.add_get("/games", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        master_server.url = str(self.server.make_url("/games"))
+        master_server.retry_base_delay = 0
+        master_server._etag = master_server._last_modified = master_server._last_digest = None
+        master_server._last_data = []
+        master_server._snapshot = None
+        master_server._last_failure = None
+        await master_server.open_session()
+
+    async def asyncTearDown(self):
+        await master_server.close_session()
+        await self.server.close()
+
+    async def test_not_modified_returns_the_previous_payload(self):
+        self.responses = [web.Response(body=json.dumps(GAMES), headers={"ETag": '"v1"'}),
+                          web.Response(status=304)]
+
+        first = await master_server.fetch_game_data()
+        second = await master_server.fetch_game_data()
+
+        self.assertEqual(first, GAMES)
+        self.assertIs(second, first)
+        self.assertEqual(self.requests[1].headers.get("If-None-Match"), '"v1"')
+
+    async def test_server_errors_are_retried(self):
+        self.responses = [web.Response(status=503), web.Response(status=429),
+                          web.Response(body=json.dumps(GAMES))]
+
+        self.assertEqual(await master_server.fetch_game_data(), GAMES)
+        self.assertEqual(len(self.requests), 3)
+
+    async def test_client_errors_are_not_retried(self):
+        self.responses = [web.Response(status=404)]
+
+        with self.assertRaises(master_server.MasterServerError):
+            await master_server.fetch_game_data()
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_failed_refresh_keeps_the_previous_snapshot_out_of_service(self):
+        self.responses = [web.Response(body=json.dumps(GAMES))] + [web.Response(status=503) for _ in range(master_server.max_retries + 1)]
+
+        await master_server.get_snapshot()
+        with self.assertRaises(master_server.MasterServerError):
+            await master_server.get_snapshot(max_age=0)
+        # the failure is not retried by every caller, and the old games are not served as current
+        with self.assertRaises(master_server.MasterServerError):
+            await master_server.get_snapshot(max_age=60)
+        self.assertEqual(len(self.requests), master_server.max_retries + 2)
+        # but still used to pick the fetch interval
+        self.assertEqual(master_server.latest_snapshot().games, GAMES)
+
+    async def test_concurrent_snapshot_requests_share_one_fetch(self):
+        self.responses = [web.Response(body=json.dumps(GAMES + [{"name": "other", "mod": "ra", "players": 4}]))]
+
+        snapshots = await asyncio.gather(*[master_server.get_snapshot() for _ in range(10)])
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(all(snapshot is snapshots[0] for snapshot in snapshots))
+        self.assertEqual(snapshots[0].games, GAMES)
+
+    async def test_stale_snapshots_are_refreshed(self):
+        self.responses = [web.Response(body=json.dumps([])), web.Response(body=json.dumps(GAMES))]
+
+        await master_server.get_snapshot()
+        cached = await master_server.get_snapshot(max_age=60)
+        refreshed = await master_server.get_snapshot(max_age=0)
+
+        self.assertEqual(cached.games, [])
+        self.assertEqual(refreshed.games, GAMES)
+        self.assertEqual(len(self.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import logging
+import metrics
+
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        self.histogram = metrics.Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1, 10))
+
+    def tearDown(self):
+        metrics._registry.remove(self.histogram)
+
+    def test_prometheus_buckets_are_cumulative(self):
+        for value in (0.05, 0.5, 0.5, 5, 50):
+            self.histogram.observe(value, stage="fetch")
+
+        lines = self.histogram.render()
+
+        self.assertIn('test_seconds_bucket{stage="fetch",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="fetch",le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="fetch",le="10"} 4', lines)
+        self.assertIn('test_seconds_bucket{stage="fetch",le="+Inf"} 5', lines)
+        self.assertIn('test_seconds_count{stage="fetch"} 5', lines)
+        self.assertIn('test_seconds_sum{stage="fetch"} 56.05', lines)
+
+    def test_quantiles_are_interpolated_inside_the_bucket(self):
+        for _ in range(10):
+            self.histogram.observe(0.5, stage="save")
+
+        self.assertAlmostEqual(self.histogram.quantile(0.5, stage="save"), 0.55)
+        self.assertIsNone(self.histogram.quantile(0.5, stage="other"))
+
+    def test_time_observes_failing_blocks(self):
+        with self.assertRaises(ValueError):
+            with self.histogram.time(stage="publish"):
+                raise ValueError()
+
+        self.assertEqual(self.histogram.get_count(stage="publish"), 1)
+
+
+class TestRateLimitLogHandler(unittest.TestCase):
+    def test_rate_limit_warnings_are_counted(self):
+        counter = metrics.Counter("test_rate_limits_total", "Test counter.")
+        self.addCleanup(metrics._registry.remove, counter)
+        log = logging.getLogger("test_metrics.http")
+        handler = metrics.RateLimitLogHandler(counter)
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+
+        log.warning("We are being rate limited. POST /channels/1/messages responded with 429.")
+        log.warning("Something else happened.")
+
+        self.assertEqual(counter.get(scope="route"), 1)
+        self.assertIn("# TYPE test_rate_limits_total counter", metrics.render_prometheus())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import asyncio
+import os
+import tempfile
+from unittest import mock
+import db
+import main
+import master_server
+import overviews
+
+
+GAMES = [{"name": "game", "players": 2, "version": "1.06", "state": 1, "clients": []}]
+
+
+class TestOverviewSubscriptions(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        db.init(os.path.join(self.directory.name, 'games_db.sqlite'))
+        main.forget_overview(list(main.overview_digests))
+
+    def tearDown(self):
+        db.close()
+        self.directory.cleanup()
+
+    def test_one_subscription_per_channel(self):
+        async def run():
+            await db.write(overviews.add_subscription, 1, 10, 100)
+            await db.write(overviews.add_subscription, 1, 10, 101)
+            await db.write(overviews.add_subscription, 2, 20, 200)
+            return await db.read(overviews.get_subscriptions)
+
+        self.assertEqual(sorted(asyncio.run(run())), [(1, 101), (2, 200)])
+
+    def test_embed_is_rendered_once_and_unchanged_messages_are_skipped(self):
+        edits = []
+
+        async def edit_overview(channel_id, message_id, embed, digest):
+            edits.append((channel_id, embed))
+            main.overview_digests[channel_id] = digest
+            main.overview_edit_times[channel_id] = main.time.monotonic()
+            return True
+
+        async def run():
+            for channel_id in range(1, 4):
+                await db.write(overviews.add_subscription, channel_id, None, channel_id * 100)
+            await main.publish_overview(GAMES)
+            await main.publish_overview(GAMES)
+
+        with mock.patch.object(main, "edit_overview", edit_overview):
+            asyncio.run(run())
+
+        self.assertEqual(sorted(channel_id for channel_id, _ in edits), [1, 2, 3])
+        self.assertEqual(len({id(embed) for _, embed in edits}), 1)
+
+    def test_dead_channels_are_removed(self):
+        async def edit_overview(channel_id, message_id, embed, digest):
+            return channel_id != 2
+
+        async def run():
+            for channel_id in range(1, 4):
+                await db.write(overviews.add_subscription, channel_id, None, channel_id * 100)
+            await main.publish_overview(GAMES)
+            return await db.read(overviews.get_subscriptions)
+
+        with mock.patch.object(main, "edit_overview", edit_overview):
+            self.assertEqual(sorted(asyncio.run(run())), [(1, 100), (3, 300)])
+
+    def test_jobs_skip_the_tick_when_the_master_server_is_down(self):
+        edits = []
+
+        async def edit_overview(channel_id, message_id, embed, digest):
+            edits.append(channel_id)
+            return True
+
+        async def run():
+            await db.write(overviews.add_subscription, 1, None, 100)
+            await main.publish_job()
+            await main.persist_job()
+
+        failure = master_server.MasterServerError("down")
+        with mock.patch.object(main, "edit_overview", edit_overview), \
+                mock.patch.object(master_server, "get_snapshot", side_effect=failure), \
+                mock.patch.object(main, "save_data_to_db") as save_data_to_db:
+            asyncio.run(run())
+
+        self.assertEqual(edits, [])
+        save_data_to_db.assert_not_called()
+
+    def test_games_command_reports_outages(self):
+        interaction = mock.MagicMock()
+        interaction.response.defer = mock.AsyncMock()
+        interaction.followup.send = mock.AsyncMock()
+
+        with mock.patch.object(master_server, "get_snapshot", side_effect=master_server.MasterServerError("down")):
+            asyncio.run(main.games.callback(interaction))
+
+        self.assertIn("down", interaction.followup.send.call_args.args[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
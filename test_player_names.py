@@ -0,0 +1,77 @@
+import unittest
+import sqlite3
+import history
+import player_names
+
+
+def create_games(*players):
+    return [{"name": "game", "version": "1.06", "players": len(players), "clients": [{"name": player} for player in players]}]
+
+
+class TestPlayerNames(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        history.ensure_schema(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_names_are_updated_from_snapshots(self):
+        history.insert_snapshot(self.conn, 60, create_games("sniper", "Tank"))
+        history.insert_snapshot(self.conn, 120, create_games("Sniper"))
+        # an older snapshot written late keeps the newest spelling
+        history.insert_snapshot(self.conn, 30, create_games("SNIPER"))
+
+        rows = self.conn.execute('SELECT name, first_seen, last_seen FROM player_names ORDER BY name_lower').fetchall()
+        self.assertEqual(rows, [("Sniper", 30, 120), ("Tank", 60, 60)])
+
+    def test_search_ignores_case_and_punctuation(self):
+        history.insert_snapshot(self.conn, 60, create_games("[XX] Sniper", "sniper", "Snipe_Master", "Tank"))
+        history.insert_snapshot(self.conn, 120, create_games("Snipe_Master"))
+
+        names = [name for name, _ in player_names.search_names(self.conn, "SNIPER")]
+        self.assertEqual(names, ["sniper", "[XX] Sniper"])
+        names = [name for name, _ in player_names.search_names(self.conn, "snipe")]
+        self.assertEqual(names, ["Snipe_Master", "sniper", "[XX] Sniper"])
+        self.assertEqual(player_names.search_names(self.conn, "xx_sniper"), [("[XX] Sniper", 60)])
+
+    def test_short_queries_match_prefixes(self):
+        history.insert_snapshot(self.conn, 60, create_games("ab", "abc", "cab"))
+
+        self.assertEqual([name for name, _ in player_names.search_names(self.conn, "AB")], ["ab", "abc"])
+        self.assertEqual(player_names.search_names(self.conn, "!!"), [])
+
+    def test_backfill_from_sessions(self):
+        history.insert_snapshot(self.conn, 60, create_games("Sniper"))
+        self.conn.execute('DELETE FROM player_names')
+        self.conn.execute("INSERT INTO player_names_fts (player_names_fts) VALUES ('rebuild')")
+
+        self.assertEqual(player_names.backfill_names(self.conn), 1)
+        self.assertEqual(player_names.search_names(self.conn, "nipe"), [("sniper", 60)])
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        player_names.build_name_index([("Sniper", 100), ("snail", 300), ("Tank", 200), ("SNOW", 50)])
+
+    def test_prefix_matches_are_ranked_by_last_seen(self):
+        self.assertEqual(player_names.complete_name("SN"), ["snail", "Sniper", "SNOW"])
+        self.assertEqual(player_names.complete_name("sni"), ["Sniper"])
+        self.assertEqual(player_names.complete_name("x"), [])
+        self.assertEqual(player_names.complete_name("", limit=2), ["snail", "Tank"])
+
+    def test_online_names_rank_first(self):
+        player_names.update_name_index(create_games("snow", "Snake"), 250)
+
+        self.assertEqual(player_names.complete_name("sn"), ["Snake", "snow", "snail", "Sniper"])
+        player_names.update_name_index(create_games(), 260)
+        self.assertEqual(player_names.complete_name("sn"), ["snail", "Snake", "snow", "Sniper"])
+
+    def test_old_names_are_pruned(self):
+        player_names.prune_name_index(150)
+
+        self.assertEqual(player_names.complete_name(""), ["snail", "Tank"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import sqlite3
+import history
+import player_sessions
+
+
+def create_games(*games):
+    # each game is (name, [player names])
+    return [{"name": name, "version": "1.06", "players": len(players), "clients": [{"name": player} for player in players]}
+            for name, players in games]
+
+
+def get_sessions(conn):
+    return conn.execute('SELECT name_lower, game_name, start_ts, end_ts FROM player_sessions ORDER BY name_lower, start_ts').fetchall()
+
+
+class TestPlayerSessions(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        history.ensure_schema(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_sessions_are_extended_and_closed(self):
+        history.insert_snapshot(self.conn, 60, create_games(("a", ["Alice", "Bob"])))
+        history.insert_snapshots(self.conn, [
+            (120, create_games(("a", ["Alice", "Bob"]))),
+            (180, create_games(("a", ["Alice"]), ("b", ["Bob"]))),
+        ])
+        history.insert_snapshot(self.conn, 240, create_games(("a", ["alice"])))
+
+        self.assertEqual(get_sessions(self.conn), [
+            ("alice", "a", 60, 240),
+            ("bob", "a", 60, 120),
+            ("bob", "b", 180, 180),
+        ])
+
+    def test_gaps_close_open_sessions(self):
+        history.insert_snapshot(self.conn, 60, create_games(("a", ["Alice"])))
+        history.insert_snapshot(self.conn, 60 + player_sessions.MAX_SESSION_GAP + 1, create_games(("a", ["Alice"])))
+
+        self.assertEqual(get_sessions(self.conn), [
+            ("alice", "a", 60, 60),
+            ("alice", "a", 61 + player_sessions.MAX_SESSION_GAP, 61 + player_sessions.MAX_SESSION_GAP),
+        ])
+
+    def test_old_snapshots_are_ignored(self):
+        history.insert_snapshot(self.conn, 120, create_games(("a", ["Alice"])))
+        history.insert_snapshot(self.conn, 60, create_games(("a", ["Bob"])))
+
+        self.assertEqual(get_sessions(self.conn), [("alice", "a", 120, 120)])
+
+    def test_duplicate_timestamps_are_skipped(self):
+        history.insert_snapshots(self.conn, [
+            (60, create_games(("a", ["Alice"]))),
+            (60, create_games(("b", ["Bob"]))),
+            (120, create_games(("a", ["Alice"]))),
+        ])
+        history.insert_snapshot(self.conn, 120, create_games(("a", ["Bob"])))
+
+        self.assertEqual(get_sessions(self.conn), [("alice", "a", 60, 120)])
+
+    def test_backfill_matches_incremental_sessions(self):
+        for i in range(10):
+            history.insert_snapshot(self.conn, 60 * i, create_games(("a", ["Alice"] if i % 4 else ["Bob"])))
+        incremental = get_sessions(self.conn)
+
+        self.conn.execute('DELETE FROM player_sessions')
+        self.conn.execute('DELETE FROM player_sessions_watermark')
+        self.assertEqual(player_sessions.backfill_sessions(self.conn, batch_size=3), 10)
+        self.assertEqual(get_sessions(self.conn), incremental)
+        self.assertEqual(player_sessions.get_watermark(self.conn), 540)
+
+    def test_play_time_is_clipped_to_the_range(self):
+        for timestamp in range(0, 601, 60):
+            history.insert_snapshot(self.conn, timestamp, create_games(("a", ["Alice"])))
+
+        self.assertEqual(player_sessions.get_play_time(self.conn, "ALICE", 300, 10000), 300)
+        self.assertEqual(player_sessions.get_last_session(self.conn, "alice"), ("a", "1.06", 0, 600))
+        self.assertIsNone(player_sessions.get_last_session(self.conn, "bob"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import unittest
+import asyncio
+import sqlite3
+import json
+import os
+import tempfile
+from unittest import mock
+import discord
+import db
+import main
+import reminders
+
+
+class TestReminders(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('''
+            CREATE TABLE reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                discord_id INTEGER NOT NULL UNIQUE,
+                names TEXT NOT NULL
+            )
+        ''')
+        reminders.build_index([])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_legacy_reminders_are_moved_to_reminder_names(self):
+        self.conn.execute('INSERT INTO reminders (discord_id, names) VALUES (?, ?)', (1, json.dumps(["Alice", "bob"])))
+
+        reminders.ensure_schema(self.conn)
+        reminders.ensure_schema(self.conn)
+
+        self.assertEqual(sorted(reminders.get_all_reminder_names(self.conn)), [("alice", 1), ("bob", 1)])
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM reminders').fetchone()[0], 0)
+
+    def test_duplicate_reminders_are_rejected(self):
+        reminders.ensure_schema(self.conn)
+
+        self.assertTrue(reminders.add_reminder_name(self.conn, 1, "alice"))
+        self.assertFalse(reminders.add_reminder_name(self.conn, 1, "Alice"))
+
+    def test_only_online_names_are_matched(self):
+        reminders.build_index([("alice", 1), ("bob", 1), ("bob", 2), ("carol", 3)])
+
+        matches = reminders.match_reminders({"bob", "dave"})
+
+        self.assertEqual(matches, {1: ["bob"], 2: ["bob"]})
+
+    def test_unindexed_reminders_are_no_longer_matched(self):
+        reminders.build_index([("alice", 1), ("bob", 1), ("bob", 2)])
+
+        reminders.unindex_reminder_names(1, ["bob"])
+        reminders.unindex_reminder_names(2)
+
+        self.assertEqual(reminders.match_reminders({"alice", "bob"}), {1: ["alice"]})
+        self.assertEqual(reminders._names_by_user, {1: {"alice"}})
+
+
+def create_http_error(error, status, headers=None):
+    return error(mock.Mock(status=status, reason="", headers=headers or {}), "")
+
+
+def create_games(*names):
+    return [{"name": "game", "players": len(names), "clients": [{"name": name} for name in names]}]
+
+
+class TestReminderDelivery(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        db.init(os.path.join(self.directory.name, 'games_db.sqlite'))
+        reminders.build_index([])
+        # discord_id -> list of results of user.send, exceptions are raised
+        self.results = {}
+        self.sent = []
+        self.patches = [
+            mock.patch.object(main.bot, "get_user", return_value=None),
+            mock.patch.object(main.bot, "fetch_user", side_effect=self.fetch_user),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        reminders.build_index([])
+        db.close()
+        self.directory.cleanup()
+
+    async def fetch_user(self, discord_id):
+        async def send(text):
+            result = self.results[discord_id].pop(0)
+            if isinstance(result, Exception):
+                raise result
+            self.sent.append(discord_id)
+
+        return mock.Mock(send=send)
+
+    async def add_reminders(self, reminder_names):
+        for name, discord_id in reminder_names:
+            await db.write(reminders.add_reminder_name, discord_id, name)
+            reminders.index_reminder_name(discord_id, name)
+
+    def test_delivered_reminders_are_removed_and_failed_ones_are_kept(self):
+        self.results = {
+            1: [None],
+            2: [create_http_error(discord.HTTPException, 429, {"Retry-After": "0"}), None],
+            3: [create_http_error(discord.Forbidden, 403)],
+        }
+        writes = []
+        write = db.write
+
+        async def spy_write(fn, *args):
+            writes.append(fn)
+            return await write(fn, *args)
+
+        async def run():
+            await self.add_reminders([("alice", 1), ("bob", 1), ("alice", 2), ("alice", 3), ("carol", 3)])
+            with mock.patch.object(db, "write", spy_write):
+                await main.check_for_reminders(create_games("Alice", "Bob"))
+            return await db.read(reminders.get_all_reminder_names)
+
+        self.assertEqual(sorted(asyncio.run(run())), [("alice", 3), ("carol", 3)])
+        self.assertEqual(sorted(self.sent), [1, 2])
+        # every delivered reminder of the tick is removed in one transaction
+        self.assertEqual(writes, [reminders.remove_matched_reminders])
+        self.assertEqual({discord_id: sorted(names) for discord_id, names in reminders.match_reminders({"alice", "bob", "carol"}).items()},
+                         {3: ["alice", "carol"]})
+
+    def test_rate_limits_are_retried_until_the_attempts_run_out(self):
+        self.results = {1: [discord.RateLimited(0)] * main.max_reminder_attempts}
+
+        async def run():
+            await self.add_reminders([("alice", 1)])
+            await main.check_for_reminders(create_games("alice"))
+            return await db.read(reminders.get_all_reminder_names)
+
+        self.assertEqual(asyncio.run(run()), [("alice", 1)])
+        self.assertEqual(self.results[1], [])
+        self.assertEqual(self.sent, [])
+        self.assertEqual(reminders.match_reminders({"alice"}), {1: ["alice"]})
+
+    def test_sends_are_bounded_by_the_semaphore(self):
+        running = []
+        most_running = []
+
+        async def fetch_user(discord_id):
+            async def send(text):
+                running.append(discord_id)
+                most_running.append(len(running))
+                await asyncio.sleep(0.01)
+                running.remove(discord_id)
+
+            return mock.Mock(send=send)
+
+        async def run():
+            await self.add_reminders([("alice", discord_id) for discord_id in range(10)])
+            # created on the loop of the test
+            with mock.patch.object(main, "reminder_semaphore", asyncio.Semaphore(3)), \
+                    mock.patch.object(main.bot, "fetch_user", side_effect=fetch_user):
+                await main.check_for_reminders(create_games("alice"))
+            return await db.read(reminders.get_all_reminder_names)
+
+        self.assertEqual(asyncio.run(run()), [])
+        self.assertEqual(len(most_running), 10)
+        self.assertEqual(max(most_running), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
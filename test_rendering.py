@@ -0,0 +1,92 @@
+import unittest
+import asyncio
+import concurrent.futures
+import datetime
+import io
+import threading
+from unittest import mock
+import rendering
+
+
+class TestChartCache(unittest.TestCase):
+    def setUp(self):
+        rendering._chart_cache.clear()
+        rendering._chart_cache_bytes = 0
+        rendering.chart_cache_max_bytes = 10
+        rendering.chart_cache_max_age = 300
+
+    def test_least_recently_used_charts_are_evicted(self):
+        rendering.cache_chart(("day", "UTC"), io.BytesIO(b"aaaa"))
+        rendering.cache_chart(("week", "UTC"), io.BytesIO(b"bbbb"))
+        rendering.get_cached_chart(("day", "UTC"))
+        rendering.cache_chart(("month", "UTC"), io.BytesIO(b"cccc"))
+
+        self.assertIsNone(rendering.get_cached_chart(("week", "UTC")))
+        self.assertEqual(rendering.get_cached_chart(("day", "UTC")).getvalue(), b"aaaa")
+        self.assertEqual(rendering._chart_cache_bytes, 8)
+
+    def test_old_charts_are_not_served(self):
+        rendering.cache_chart(("day", "UTC"), io.BytesIO(b"aaaa"))
+        rendering.chart_cache_max_age = -1
+
+        self.assertIsNone(rendering.get_cached_chart(("day", "UTC")))
+        self.assertEqual(rendering._chart_cache_bytes, 0)
+
+
+
+class TestRendering(unittest.TestCase):
+    def setUp(self):
+        # threads instead of worker processes, so the patched create_plot is used
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.patches = [mock.patch.object(rendering, "_pool", self.pool),
+                        mock.patch.object(rendering, "max_pending_renders", 1)]
+        for patch in self.patches:
+            patch.start()
+        rendering._pending_renders = 0
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.pool.shutdown()
+
+    def test_series_with_gaps_are_rendered_as_png(self):
+        start = datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc)
+        x_times = [start + datetime.timedelta(hours=hour) for hour in range(24)]
+        y_values = [None if 5 <= hour < 9 else hour % 7 for hour in range(24)]
+
+        png = rendering.create_plot(x_times, y_values, "Players", "Time", "Players", "day", "Europe/Berlin", profile="low")
+
+        self.assertTrue(png.startswith(b"\x89PNG"))
+
+    def test_full_queue_rejects_renders_until_one_is_done(self):
+        release = threading.Event()
+
+        def create_plot(*args):
+            release.wait(5)
+            return b"png"
+
+        async def run():
+            rendering_task = asyncio.create_task(rendering.render_plot([], [], "title", "x", "y"))
+            await asyncio.sleep(0)
+            self.assertEqual(rendering._pending_renders, 1)
+            with self.assertRaises(rendering.RenderQueueFullError):
+                await rendering.render_plot([], [], "title", "x", "y")
+            release.set()
+            return (await rendering_task).getvalue()
+
+        with mock.patch.object(rendering, "create_plot", create_plot):
+            self.assertEqual(asyncio.run(run()), b"png")
+        self.assertEqual(rendering._pending_renders, 0)
+
+    def test_failed_renders_leave_the_queue(self):
+        async def run():
+            with self.assertRaises(ValueError):
+                await rendering.render_plot([], [], "title", "x", "y")
+
+        with mock.patch.object(rendering, "create_plot", side_effect=ValueError("bad timezone")):
+            asyncio.run(run())
+        self.assertEqual(rendering._pending_renders, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
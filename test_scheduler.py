@@ -0,0 +1,75 @@
+import unittest
+import asyncio
+import time
+from unittest import mock
+import scheduler
+
+
+class TestNextBoundary(unittest.TestCase):
+    def test_boundaries_are_aligned_to_the_interval(self):
+        self.assertEqual(scheduler.next_boundary(119.5, 60), 120)
+        self.assertEqual(scheduler.next_boundary(120, 60), 180)
+        self.assertEqual(scheduler.next_boundary(121, 60, offset=2), 122)
+        self.assertEqual(scheduler.next_boundary(122, 60, offset=2), 182)
+
+    def test_backoff_doubles_up_to_the_limit(self):
+        with mock.patch("random.uniform", return_value=1.0):
+            self.assertEqual([scheduler.get_backoff_delay(failures, 30, 300) for failures in range(1, 6)],
+                             [30, 60, 120, 240, 300])
+
+
+class TestRunPeriodic(unittest.IsolatedAsyncioTestCase):
+    async def run_job(self, job, interval, duration, **kwargs):
+        task = asyncio.create_task(scheduler.run_periodic("test", job, interval, **kwargs))
+        await asyncio.sleep(duration)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_slow_runs_do_not_shift_the_grid(self):
+        starts = []
+
+        async def job():
+            starts.append(time.time())
+            await asyncio.sleep(0.03)
+
+        await self.run_job(job, 0.1, 0.55)
+
+        self.assertGreaterEqual(len(starts), 4)
+        for start in starts:
+            # every run starts right after a boundary, the processing time does not accumulate
+            self.assertLess(start % 0.1, 0.02)
+
+    async def test_failures_are_retried_with_backoff(self):
+        calls = []
+
+        async def job():
+            calls.append(time.time())
+            if len(calls) <= 2:
+                raise RuntimeError("master server down")
+
+        with mock.patch("random.uniform", return_value=1.0):
+            await self.run_job(job, 0.05, 0.5, run_at_start=True)
+
+        # starts at once, retries after 0.05 and 0.1 seconds, then follows the grid again
+        self.assertGreaterEqual(len(calls), 5)
+        # sleeps only overshoot, under load by more than a few milliseconds
+        self.assertTrue(0.045 <= calls[1] - calls[0] < 0.1)
+        self.assertTrue(0.095 <= calls[2] - calls[1] < 0.2)
+        self.assertGreaterEqual(scheduler.job_failures.get(job="test"), 2)
+
+    async def test_interval_function_changes_the_cadence(self):
+        calls = []
+
+        async def job():
+            calls.append(time.time())
+
+        await self.run_job(job, lambda: 0.2 if len(calls) >= 2 else 0.05, 0.6)
+
+        # a late first run moves the second one closer, the grid only bounds the gap from above
+        self.assertLess(calls[1] - calls[0], 0.15)
+        self.assertGreater(calls[3] - calls[2], 0.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
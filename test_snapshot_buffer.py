@@ -0,0 +1,116 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+import db
+import history
+import snapshot_buffer
+
+
+def count_snapshots(conn):
+    return conn.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+
+class TestSnapshotBuffer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        db.init(os.path.join(self.directory.name, 'games_db.sqlite'))
+        snapshot_buffer.journal_path = os.path.join(self.directory.name, 'snapshot_journal.jsonl')
+        snapshot_buffer.flush_size = 3
+        snapshot_buffer._pending.clear()
+        snapshot_buffer._oldest_pending = None
+
+    def tearDown(self):
+        db.close()
+        self.directory.cleanup()
+
+    def test_snapshots_are_written_in_batches(self):
+        async def run():
+            counts = []
+            for i in range(4):
+                await snapshot_buffer.add(60 * i, [{"name": "game", "players": i}])
+                counts.append(await db.read(count_snapshots))
+            return counts
+
+        self.assertEqual(asyncio.run(run()), [0, 0, 3, 3])
+        self.assertEqual(snapshot_buffer.get_pending_count(), 1)
+        # only the pending snapshot is left in the journal
+        with open(snapshot_buffer.journal_path) as f:
+            self.assertEqual([json.loads(line)["timestamp"] for line in f], [180])
+
+    def test_failed_flushes_keep_the_batch(self):
+        async def run():
+            with mock.patch.object(history, "insert_snapshots", side_effect=OSError("disk full")):
+                for i in range(3):
+                    await snapshot_buffer.add(60 * i, [])
+            self.assertEqual(snapshot_buffer.get_pending_count(), 3)
+            await snapshot_buffer.flush()
+            return await db.read(count_snapshots)
+
+        self.assertEqual(asyncio.run(run()), 3)
+        self.assertFalse(os.path.exists(snapshot_buffer.journal_path))
+
+    def test_journal_is_written_off_the_event_loop_and_in_order(self):
+        journal_threads = []
+        append_to_journal = snapshot_buffer._append_to_journal
+        truncate_journal = snapshot_buffer._truncate_journal
+        insert_snapshots = history.insert_snapshots
+        inserting = threading.Event()
+
+        def spy_append(*args):
+            journal_threads.append(threading.current_thread())
+            append_to_journal(*args)
+
+        def spy_truncate(*args):
+            journal_threads.append(threading.current_thread())
+            truncate_journal(*args)
+
+        def slow_insert(*args):
+            inserting.set()
+            time.sleep(0.05)
+            return insert_snapshots(*args)
+
+        async def run():
+            for i in range(2):
+                await snapshot_buffer.add(60 * i, [])
+            flushing = asyncio.create_task(snapshot_buffer.add(120, []))
+            await asyncio.to_thread(inserting.wait, 5)
+            # adds during the slow flush wait for it and are journaled after its rewrite
+            for i in range(3, 5):
+                await snapshot_buffer.add(60 * i, [])
+            await flushing
+
+        with mock.patch.object(snapshot_buffer, "_flush_lock", asyncio.Lock()), \
+                mock.patch.object(snapshot_buffer, "_append_to_journal", spy_append), \
+                mock.patch.object(snapshot_buffer, "_truncate_journal", spy_truncate), \
+                mock.patch.object(history, "insert_snapshots", slow_insert):
+            asyncio.run(run())
+
+        self.assertEqual(len(journal_threads), 6)
+        self.assertNotIn(threading.main_thread(), journal_threads)
+        self.assertEqual([timestamp for timestamp, _ in snapshot_buffer._pending], [180, 240])
+        with open(snapshot_buffer.journal_path) as f:
+            self.assertEqual([json.loads(line)["timestamp"] for line in f], [180, 240])
+
+    def test_journal_is_recovered_without_duplicates(self):
+        with open(snapshot_buffer.journal_path, "w") as f:
+            for timestamp in (60, 120):
+                f.write(json.dumps({"timestamp": timestamp, "games": [{"name": "game", "players": 2}]}) + "\n")
+            f.write('{"timestamp": 180, "ga')
+
+        async def run():
+            # the snapshot at 60 was already committed before the crash
+            await db.write(history.insert_snapshot, 60, [{"name": "game", "players": 2}])
+            recovered = await snapshot_buffer.recover()
+            return recovered, await db.read(count_snapshots)
+
+        self.assertEqual(asyncio.run(run()), (1, 2))
+        self.assertFalse(os.path.exists(snapshot_buffer.journal_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import sqlite3
+import json
+import history
+import snapshot_store
+
+
+def create_game(name, players):
+    return {"name": name, "mod": "ca", "players": players, "state": 1,
+            "clients": [{"name": f"{name} player {i}", "isbot": False} for i in range(players)]}
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        history.ensure_schema(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_snapshots_are_rebuilt_for_any_timestamp(self):
+        history.insert_snapshot(self.conn, 60, [create_game("a", 1)])
+        history.insert_snapshot(self.conn, 120, [create_game("a", 1), create_game("b", 2)])
+
+        self.assertIsNone(snapshot_store.load_snapshot(self.conn, 59))
+        self.assertEqual(snapshot_store.load_snapshot(self.conn, 119), (60, [create_game("a", 1)]))
+        self.assertEqual(snapshot_store.load_snapshot(self.conn, 500), (120, [create_game("a", 1), create_game("b", 2)]))
+
+    def test_unchanged_games_are_stored_once(self):
+        for timestamp in range(0, 600, 60):
+            history.insert_snapshot(self.conn, timestamp, [create_game("a", 1), create_game("b", 2)])
+        history.insert_snapshot(self.conn, 600, [create_game("a", 2), create_game("b", 2)])
+
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM game_records').fetchone()[0], 3)
+
+    def test_playtime_is_stored_per_snapshot(self):
+        snapshots = []
+        for minute in range(5):
+            started = dict(create_game("a", 2), state=2, playtime=60 * minute)
+            snapshots.append((60 * minute, [create_game("lobby", 1), started, create_game("b", 1)]))
+        snapshots[0][1][0]["playtime"] = -1
+        for timestamp, games in snapshots:
+            history.insert_snapshot(self.conn, timestamp, games)
+
+        # the running game needs one record, not one per minute
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM game_records').fetchone()[0], 4)
+        self.assertEqual([(timestamp, games) for _, timestamp, games in snapshot_store.iter_snapshots(self.conn, 0, 600)],
+                         snapshots)
+
+    def test_full_cache_keeps_the_records_of_the_current_snapshot(self):
+        snapshots = [[create_game("lobby", 1), create_game("a", 1)],
+                     [create_game("lobby", 1), create_game("b", 1), create_game("c", 1)]]
+        for i, games in enumerate(snapshots):
+            history.insert_snapshot(self.conn, 60 * (i + 1), games)
+
+        # the second snapshot has the cached lobby and two new records, more than the cache holds
+        reader = snapshot_store.SnapshotReader(self.conn, cache_size=3)
+        rows = self.conn.execute('SELECT games_data, game_hashes FROM games ORDER BY timestamp').fetchall()
+        self.assertEqual([reader.decode(*row) for row in rows], snapshots)
+
+    def test_old_rows_are_read_and_migrated(self):
+        games = [create_game("a", 1), create_game("b", 2)]
+        self.conn.execute('INSERT INTO games (timestamp, games_data) VALUES (?, ?)', (60, json.dumps(games)))
+        self.assertEqual(snapshot_store.load_snapshot(self.conn, 60), (60, games))
+
+        self.assertEqual(snapshot_store.migrate_games_table(self.conn), 1)
+
+        self.assertEqual(self.conn.execute('SELECT games_data FROM games').fetchone()[0], '')
+        self.assertEqual([(timestamp, snapshot) for _, timestamp, snapshot in snapshot_store.iter_snapshots(self.conn, 0, 120)],
+                         [(60, games)])
+        self.assertEqual(snapshot_store.migrate_games_table(self.conn), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,8 @@
 """Test script to verify SQLite database operations work correctly."""
 
 import sqlite3
-import json
 import datetime
+import snapshot_store
 
 def test_database():
     print("Testing SQLite database operations...")
@@ -19,11 +19,11 @@ def test_database():
     
     # Test 2: Get a sample game entry
     print("\n2. Fetching sample game entry...")
-    cursor.execute('SELECT timestamp, games_data FROM games LIMIT 1')
+    cursor.execute('SELECT timestamp, games_data, game_hashes FROM games LIMIT 1')
     result = cursor.fetchone()
     if result:
-        timestamp, games_data = result
-        games = json.loads(games_data)
+        timestamp, games_data, game_hashes = result
+        games = snapshot_store.SnapshotReader(conn).decode(games_data, game_hashes)
         dt = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
         print(f"   ✓ Timestamp: {dt}")
         print(f"   ✓ Number of games: {len(games)}")